@@ -0,0 +1,327 @@
+"""
+Guardian Bot - Çevrimdışı Moderasyon Benchmark'ı
+Mesajları sahte Discord nesneleriyle GuardianBot.handle_message üzerinden geçirir;
+ağ, Discord token'ı veya Gemini anahtarı gerektirmez.
+
+Kullanım:
+    python benchmark.py                       # sentetik 5000 mesaj
+    python benchmark.py --messages 20000 --ai # yerel Gemini taklidiyle
+    python benchmark.py --corpus mesajlar.txt # kayıtlı mesajlar (satır başına bir mesaj
+                                              # ya da content/user_id/channel_id içeren JSONL)
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+import guardian_bot
+from guardian_bot import bot
+
+# ==================== SAHTE DISCORD NESNELERİ ====================
+
+class FakeGuild:
+    def __init__(self, guild_id: int):
+        self.id = guild_id
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+
+    async def send(self, *args, **kwargs):
+        FakeMessage.replies += 1
+
+class FakeMember:
+    def __init__(self, user_id: int, guild: FakeGuild):
+        self.id = user_id
+        self.guild = guild
+        self.bot = False
+        self.display_name = f"kullanici{user_id}"
+        self.mention = f"<@{user_id}>"
+        self.bans = 0
+        self.timeouts = 0
+
+    async def ban(self, **kwargs):
+        self.bans += 1
+
+    async def timeout(self, *args, **kwargs):
+        self.timeouts += 1
+
+class FakeMessage:
+    replies = 0
+
+    def __init__(self, content: str, author: FakeMember, guild: FakeGuild, channel: FakeChannel):
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.channel = channel
+        self.raw_mentions = []
+        self.raw_role_mentions = []
+        self.mention_everyone = False
+
+    async def reply(self, *args, **kwargs):
+        FakeMessage.replies += 1
+
+# ==================== GEMINI TAKLİDİ ====================
+
+class StubResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+# generate_content_async'i taklit eder; "tehdit" geçen mesajları toksik sayar
+class StubModel:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = 0
+
+    async def generate_content_async(self, prompt: str):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        verdicts = []
+        for line in prompt.splitlines():
+            if line[:1].isdigit() or line.startswith('Mesaj: '):
+                toxic = "tehdit" in line
+                verdicts.append({
+                    'is_toxic': toxic, 'severity': 7 if toxic else 0,
+                    'reason': 'Tehdit' if toxic else 'Temiz', 'category': 'threat' if toxic else 'clean'
+                })
+        if 'Mesajlar:' in prompt:
+            return StubResponse(json.dumps(verdicts))
+        return StubResponse(json.dumps(verdicts[0]))
+
+def install_stub_gemini(latency: float) -> StubModel:
+    model = StubModel(latency)
+    gemini = guardian_bot.GeminiAI.__new__(guardian_bot.GeminiAI)
+    gemini.model = model
+    gemini.toxicity_cache = guardian_bot.ToxicityCache(guardian_bot.AI_CACHE_SIZE, guardian_bot.AI_CACHE_TTL)
+    gemini.rate_limiter = guardian_bot.RateLimiter(10 ** 9)
+    bot.gemini = gemini
+    bot.ai_queue = guardian_bot.AIModerationQueue(bot, gemini)
+    return model
+
+# ==================== KORPUS ====================
+
+CLEAN_MESSAGES = [
+    "selam", "ok", "lol", "günaydın herkese", "bugün maç var mı",
+    "akşam oyuna giren var mı", "teşekkürler çok yardımcı oldun",
+    "bu botu kim yazdı çok iyi", "yarın toplantı saat kaçta",
+    "şu linke bakın çok güzel bir video", "haha aynen öyle"
+]
+TOXIC_MESSAGES = [
+    "sen tam bir salaksın", "amk ya yine mi", "gerizekalı mısın",
+    "defol git buradan", "ananı", "s!kt!r git", "seni bulurum tehdit ediyorum"
+]
+LONG_MESSAGE = "```python\n" + "def fonksiyon(x):\n    return x * 2\n" * 60 + "```"
+
+def synthetic_corpus(count: int, users: int, guilds: int, seed: int) -> list:
+    rng = random.Random(seed)
+    corpus = []
+    while len(corpus) < count:
+        guild_id = rng.randint(1, guilds)
+        user_id = rng.randint(1, users)
+        channel_id = guild_id * 100 + rng.randint(1, 5)
+        roll = rng.random()
+        if roll < 0.02:
+            # Aynı kullanıcıdan kısa bir sel
+            for _ in range(10):
+                corpus.append((guild_id, user_id, channel_id, "SPAM SPAM SPAM"))
+            continue
+        if roll < 0.04:
+            content = LONG_MESSAGE
+        elif roll < 0.15:
+            content = rng.choice(TOXIC_MESSAGES)
+        else:
+            content = rng.choice(CLEAN_MESSAGES)
+            if rng.random() < 0.5:
+                content += f" {rng.randint(1, 1000)}"
+        corpus.append((guild_id, user_id, channel_id, content))
+    return corpus[:count]
+
+def load_corpus(path: str) -> list:
+    corpus = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not line:
+                continue
+            if line.startswith('{'):
+                data = json.loads(line)
+                corpus.append((
+                    data.get('guild_id', 1), data.get('user_id', 1),
+                    data.get('channel_id', 1), data['content']
+                ))
+            else:
+                corpus.append((1, len(corpus) % 500 + 1, 1, line))
+    return corpus
+
+# ==================== DOĞRULAMA ====================
+
+# Küfür algılamanın bilinen tuzakları; her benchmark'tan önce kontrol edilir.
+# Gündelik "sık/sıkıcı" temiz kalmalı, ASCII büyük harfli yazımlar yakalanmalı.
+DETECTOR_REGRESSIONS = [
+    ("çok sık geliyorsun", 'clean'),
+    ("sıkıcı bir gün", 'clean'),
+    ("sıkma canını", 'clean'),
+    ("SIKTIR", 'severe'),
+    ("PIÇ", 'severe'),
+    ("IBNE", 'mild'),
+    ("SÜLALENI", 'moderate'),
+    ("ÖLDÜREYIM", 'moderate'),
+    ("GERİZEKALI", 'mild'),
+    ("sen gerizekalısın", 'mild'),
+]
+
+def check_detector():
+    detector = guardian_bot.ProfanityDetector()
+    for message, expected in DETECTOR_REGRESSIONS:
+        severity = detector.check(message)['severity']
+        assert severity == expected, f"{message!r}: {severity} (beklenen {expected})"
+
+# ==================== ÇALIŞTIRMA ====================
+
+def percentile(values: list, p: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1]
+
+async def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix="guardian-bench-")
+    guardian_bot.database = guardian_bot.SQLiteStorage(os.path.join(workdir, "bench.db"))
+
+    stub = install_stub_gemini(args.ai_latency / 1000) if args.ai else None
+    if not args.ai:
+        bot.gemini = None
+        bot.ai_queue = None
+
+    await guardian_bot.init_database()
+    await bot.filters.load_all()
+    bot.detection_pool.start(bot.filters.default)
+    guardian_bot.message_counters.start()
+    if bot.ai_queue:
+        bot.ai_queue.start()
+
+    queries = 0
+    def count_query(statement):
+        nonlocal queries
+        queries += 1
+    await guardian_bot.database.conn.set_trace_callback(count_query)
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        corpus = synthetic_corpus(args.messages, args.users, args.guilds, args.seed)
+
+    guilds, channels, members = {}, {}, {}
+    messages = []
+    for guild_id, user_id, channel_id, content in corpus:
+        guild = guilds.setdefault(guild_id, FakeGuild(guild_id))
+        channel = channels.setdefault(channel_id, FakeChannel(channel_id))
+        member = members.get((guild_id, user_id))
+        if member is None:
+            member = members[(guild_id, user_id)] = FakeMember(user_id, guild)
+        messages.append(FakeMessage(content, member, guild, channel))
+
+    latencies = []
+    started = time.perf_counter()
+    if args.pipeline:
+        # Gateway'den gelir gibi: her mesaj kuyruğa atılır, gruplar arka planda işlenir.
+        # Gecikme, mesajın kuyruğa girişinden grubunun işlenip bitmesine kadar ölçülür.
+        submitted = {}
+        process_batch = bot.process_batch
+        async def timed_batch(batch):
+            await process_batch(batch)
+            done = time.perf_counter()
+            latencies.extend((done - submitted.pop(id(message))) * 1000 for message in batch)
+        bot.process_batch = timed_batch
+        bot.pipeline.start()
+        for message in messages:
+            submitted[id(message)] = time.perf_counter()
+            bot.pipeline.submit(message)
+            await asyncio.sleep(0)
+        await bot.pipeline.stop()
+    else:
+        for message in messages:
+            t0 = time.perf_counter()
+            await bot.handle_message(message)
+            latencies.append((time.perf_counter() - t0) * 1000)
+    elapsed = time.perf_counter() - started
+
+    # Arka plan işleri de rapora dahil olsun
+    await asyncio.gather(*bot.actions.tasks)
+    await bot.actions.stop()
+    if bot.ai_queue:
+        await bot.ai_queue.queue.join()
+        await bot.ai_queue.stop()
+    await guardian_bot.message_counters.stop()
+    bot.detection_pool.stop()
+    total_elapsed = time.perf_counter() - started
+    await guardian_bot.database.close()
+
+    return {
+        'messages': len(messages),
+        'elapsed': elapsed,
+        'total_elapsed': total_elapsed,
+        'latencies': latencies,
+        'queries': queries,
+        'replies': FakeMessage.replies,
+        'bans': sum(member.bans for member in members.values()),
+        'timeouts': sum(member.timeouts for member in members.values()),
+        'ai_calls': stub.calls if stub else 0,
+        'ai_cache': bot.gemini.toxicity_cache.stats() if bot.gemini else None,
+        'user_cache': guardian_bot.user_cache.stats()
+    }
+
+def report(result: dict):
+    n = result['messages']
+    latencies = sorted(result['latencies'])
+    print("📊 Guardian Bot benchmark")
+    print(f"  Mesaj              : {n}")
+    print(f"  Mesaj/sn           : {n / result['elapsed']:.0f}")
+    print(f"  Gecikme p50        : {percentile(latencies, 50):.3f} ms")
+    print(f"  Gecikme p99        : {percentile(latencies, 99):.3f} ms")
+    print(f"  Gecikme max        : {latencies[-1] if latencies else 0:.3f} ms")
+    print(f"  Sorgu/mesaj        : {result['queries'] / n if n else 0:.2f}")
+    print(f"  Uyarı yanıtı       : {result['replies']}")
+    print(f"  Ban / susturma     : {result['bans']} / {result['timeouts']}")
+    print(f"  Toplam (arka plan) : {result['total_elapsed']:.2f} sn")
+    print(f"  Kullanıcı önbelleği: {result['user_cache']}")
+    if result['ai_cache'] is not None:
+        print(f"  AI çağrısı         : {result['ai_calls']}")
+        print(f"  AI önbelleği       : {result['ai_cache']}")
+    # METRICS_ENABLED=1 ile çalıştırılırsa aşama bazında dağılım
+    for stage, histogram in sorted(guardian_bot.metrics.histograms.items()):
+        avg = histogram.total / histogram.count * 1000
+        print(f"  {stage:<19}: n={histogram.count} ort={avg:.3f} ms p99≤{histogram.quantile(0.99) * 1000:g} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Guardian Bot çevrimdışı moderasyon benchmark'ı")
+    parser.add_argument('--messages', type=int, default=5000, help="sentetik mesaj sayısı")
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--guilds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--corpus', help="kayıtlı mesaj dosyası (txt veya JSONL)")
+    parser.add_argument('--ai', action='store_true', help="yerel Gemini taklidini etkinleştir")
+    parser.add_argument('--ai-latency', type=float, default=300, help="taklit Gemini gecikmesi (ms)")
+    parser.add_argument('--pipeline', action='store_true', help="mesajları toplu işleme hattından geçir")
+    parser.add_argument('--json', action='store_true', help="sonucu JSON olarak yazdır")
+    args = parser.parse_args()
+
+    check_detector()
+    result = asyncio.run(run(args))
+    if args.json:
+        latencies = sorted(result.pop('latencies'))
+        result['p50_ms'] = percentile(latencies, 50)
+        result['p99_ms'] = percentile(latencies, 99)
+        result['messages_per_sec'] = result['messages'] / result['elapsed']
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        report(result)
+
+if __name__ == "__main__":
+    main()
@@ -3,25 +3,49 @@ Guardian Bot - Discord Moderasyon ve Reputation Botu
 Tek dosya versiyonu - Bulut platformlarında çalıştırmak için
 """
 
+# Açılış raporu için: modül içe aktarma süresi de ölçülsün
+import time
+STARTUP_STARTED = time.perf_counter()
+
 import discord
 from discord.ext import commands
 from discord import app_commands
 import os
 import asyncio
 import aiosqlite
+import bisect
+import concurrent.futures
+import functools
 import json
+import hashlib
+import importlib.util
+import itertools
+import random
 import re
-from datetime import datetime
+import subprocess
+import sys
+import unicodedata
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
+# Opsiyonel paketler burada yalnızca aranır; içe aktarma ilk kullanımda yapılır
+def module_available(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
+
 # Opsiyonel: Gemini AI
-try:
-    import google.generativeai as genai
-    GEMINI_AVAILABLE = True
-except ImportError:
-    GEMINI_AVAILABLE = False
+GEMINI_AVAILABLE = module_available('google.generativeai')
+if not GEMINI_AVAILABLE:
     print("⚠️ google-generativeai yüklü değil, AI özellikleri devre dışı")
 
+# Opsiyonel: PostgreSQL (yalnızca DATABASE_URL ayarlıysa gerekir)
+ASYNCPG_AVAILABLE = module_available('asyncpg')
+
 load_dotenv()
 
 # ==================== YAPILANDIRMA ====================
@@ -35,11 +59,23 @@ MIN_REPUTATION = 0
 PROFANITY_PENALTY = 10
 INSULT_PENALTY = 15
 SEVERE_PENALTY = 25
+SPAM_PENALTY = 10
 
 # Ceza Eşikleri
 MUTE_THRESHOLD = 30
 KICK_THRESHOLD = 10
 BAN_THRESHOLD = 0
+MUTE_DURATION = 10  # dakika
+
+# Sunucular /ayar ile bunları kendi değerleriyle ezebilir
+DEFAULT_GUILD_SETTINGS = {
+    'profanity_penalty': PROFANITY_PENALTY,
+    'insult_penalty': INSULT_PENALTY,
+    'severe_penalty': SEVERE_PENALTY,
+    'spam_penalty': SPAM_PENALTY,
+    'mute_threshold': MUTE_THRESHOLD,
+    'ban_threshold': BAN_THRESHOLD
+}
 
 # Türkçe Küfür Listesi
 TURKISH_PROFANITY = [
@@ -64,6 +100,9 @@ INSULT_PATTERNS = [
     "defol", "kaybol", "çık git"
 ]
 
+# Bulunduğunda cezayı ağır seviyeye çıkaran kelimeler
+SEVERE_WORDS = ['orospu', 'piç', 'siktir', 'amk', 'aq', 'ananı', 'bacını']
+
 # Gemini Ayarları
 GEMINI_MODEL = "gemini-1.5-flash"
 GEMINI_SAFETY_PROMPT = """
@@ -77,14 +116,342 @@ Mesaj: "{message}"
 
 Sadece JSON formatında yanıt ver.
 """
+GEMINI_BATCH_SAFETY_PROMPT = """
+Aşağıdaki numaralı Türkçe mesajların her birini ayrı ayrı analiz et ve mesajlarla
+aynı sırada, aynı uzunlukta bir JSON dizisi olarak yanıt ver. Dizinin her elemanı:
+- is_toxic: mesajda küfür, hakaret veya zararlı içerik var mı (true/false)
+- severity: zararlılık seviyesi (0-10 arası)
+- reason: kısa açıklama (Türkçe)
+- category: kategori (clean/profanity/insult/threat/spam/other)
+
+Mesajlar:
+{messages}
+
+Sadece JSON dizisi olarak yanıt ver.
+"""
+
+# Arka plan AI moderasyon kuyruğu
+AI_QUEUE_SIZE = 1000
+AI_QUEUE_POLICY = "drop_oldest"   # kuyruk doluysa: drop_oldest (en eskiyi at) / skip (yeni mesajı atla)
+AI_WORKERS = 2                    # aynı anda en fazla kaç Gemini isteği
+AI_BATCH_SIZE = 10                # tek istekte en fazla kaç mesaj
+AI_BATCH_WAIT = 0.25              # saniye; parti dolana kadar en fazla bu kadar beklenir
+AI_REQUESTS_PER_MINUTE = 60
+AI_DRAIN_TIMEOUT = 10             # saniye; kapanışta kuyruktaki mesajlar için beklenen süre
+
+# /sor sohbet oturumları
+CHAT_SESSION_TTL = 1800          # saniye; bu kadar boşta kalan oturum silinir
+CHAT_MAX_SESSIONS = 1000
+CHAT_MAX_TURNS = 20              # oturum başına saklanan en fazla soru-cevap çifti
+CHAT_MAX_HISTORY_CHARS = 16000   # oturum geçmişi bunu aşarsa en eski turlar atılır
+
+# ==================== METRİKLER ====================
+
+# Süre ölçümü (histogramlar) yalnızca METRICS_ENABLED=1 iken ve örnekleme oranına göre yapılır;
+# kapalıyken zamanlayıcılar hiçbir şey yapmayan ortak bir nesne döndürür.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '0') == '1'
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', '1.0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # 0: HTTP uç noktası kapalı
+LOOP_LAG_INTERVAL = 0.5  # saniye
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+    
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+    
+    def quantile(self, q: float) -> float:
+        # Kova üst sınırına göre yaklaşık değer
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+class StageTimer:
+    __slots__ = ('metrics', 'stage', 'start')
+    
+    def __init__(self, metrics, stage: str):
+        self.metrics = metrics
+        self.stage = stage
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+class NullTimer:
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+
+NULL_TIMER = NullTimer()
+
+class Metrics:
+    def __init__(self, enabled: bool, sample_rate: float):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.histograms = {}   # aşama -> Histogram
+        self.counters = {}     # ad -> değer
+        self.gauges = {}       # ad -> değeri döndüren fonksiyon
+        self.loop_lag = 0.0
+    
+    def sampled(self) -> bool:
+        return self.enabled and (self.sample_rate >= 1.0 or random.random() < self.sample_rate)
+    
+    def timer(self, stage: str):
+        return StageTimer(self, stage) if self.sampled() else NULL_TIMER
+    
+    def observe(self, stage: str, seconds: float):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        histogram.observe(seconds)
+    
+    def inc(self, name: str, value: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + value
+    
+    def gauge(self, name: str, func):
+        self.gauges[name] = func
+    
+    def _gauge_values(self) -> dict:
+        values = {}
+        for name, func in self.gauges.items():
+            try:
+                values[name] = float(func())
+            except Exception:
+                pass
+        return values
+    
+    def render_prometheus(self) -> str:
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE guardian_{name}_total counter")
+            lines.append(f"guardian_{name}_total {value}")
+        for name, value in sorted(self._gauge_values().items()):
+            lines.append(f"# TYPE guardian_{name} gauge")
+            lines.append(f"guardian_{name} {value}")
+        if self.histograms:
+            lines.append("# TYPE guardian_stage_seconds histogram")
+        for stage, histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'guardian_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'guardian_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+            lines.append(f'guardian_stage_seconds_sum{{stage="{stage}"}} {histogram.total}')
+            lines.append(f'guardian_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+    
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            parts = request.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = "200 OK", self.render_prometheus().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+    
+    async def start_server(self, host: str, port: int):
+        return await asyncio.start_server(self._serve, host, port)
+    
+    async def monitor_loop_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag = max(0.0, loop.time() - start - LOOP_LAG_INTERVAL)
+            if self.enabled:
+                self.observe('event_loop_lag', self.loop_lag)
+
+metrics = Metrics(METRICS_ENABLED, METRICS_SAMPLE_RATE)
+
+# async fonksiyonların süresini ölçen dekoratör
+def timed(stage: str):
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not metrics.sampled():
+                return await func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                metrics.observe(stage, time.perf_counter() - start)
+        return wrapper
+    return decorator
 
 # ==================== VERİTABANI ====================
 
-DATABASE_PATH = "reputation.db"
+DATABASE_PATH = os.getenv('DATABASE_PATH', "reputation.db")
+# postgres://... verilirse tüm shard süreçleri ortak PostgreSQL'i kullanır
+DATABASE_URL = os.getenv('DATABASE_URL', '')
+POSTGRES_POOL_MIN = 1
+POSTGRES_POOL_MAX = 10
 
-async def init_database():
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("""
+# Bağlantı açılırken bir kez uygulanan SQLite ayarları
+SQLITE_PRAGMAS = (
+    # Yalnızca tablolar oluşmadan önce etkili olur (yeni veritabanları)
+    "PRAGMA auto_vacuum = INCREMENTAL",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA busy_timeout = 5000",
+)
+SQLITE_AUTO_VACUUM_INCREMENTAL = 2   # PRAGMA auto_vacuum değeri
+
+# Bağlantı başına önbelleğe alınan hazır (prepared) ifade sayısı
+SQLITE_STATEMENT_CACHE = 256
+
+# reputation_history bakımı: eski satırlar günlük özetlere katlanıp silinir
+HISTORY_RETENTION_DAYS = 30
+HISTORY_COMPACT_INTERVAL = 3600   # saniye
+HISTORY_COMPACT_BATCH = 5000      # transaction başına taşınan en fazla satır
+HISTORY_VACUUM_PAGES = 1000       # tur başına geri verilen en fazla sayfa
+
+# Reputation verisinin saklandığı arka uç. Bot yalnızca bu arayüzü kullanır;
+# tek süreçte SQLite, birden çok shard sürecinde ortak PostgreSQL çalışır.
+# Kullanıcı güncellemeleri tek bir atomik UPSERT ifadesiyle yapıldığından
+# aynı satıra farklı süreçlerden gelen değişiklikler birbirini ezmez.
+class Storage(ABC):
+    @abstractmethod
+    async def connect(self):
+        ...
+    
+    @abstractmethod
+    async def close(self):
+        ...
+    
+    # Bekleyen şema migration'larını uygular ve kaç tane uygulandığını döndürür
+    @abstractmethod
+    async def migrate(self) -> int:
+        ...
+    
+    @abstractmethod
+    async def fetch_user(self, user_id: int, guild_id: int):
+        ...
+    
+    # Kullanıcıyı oluşturur ya da değişiklikleri uygular ve güncel satırı döndürür;
+    # history verilirse (sebep, mesaj) aynı transaction'da geçmişe yazılır
+    @abstractmethod
+    async def upsert_user(self, user_id: int, guild_id: int, username: str = None, change: int = 0,
+                          warnings: int = 0, messages: int = 0, history: tuple = None):
+        ...
+    
+    # changes: (user_id, guild_id, username, change, warnings, history) listesi; hepsi tek
+    # transaction'da verilen sırayla uygulanır ve her birinin sonundaki satır döner
+    @abstractmethod
+    async def upsert_users(self, changes: list) -> list:
+        ...
+    
+    # rows: (user_id, guild_id, username, mesaj sayısı, son aktiflik)
+    @abstractmethod
+    async def add_message_counts(self, rows: list):
+        ...
+    
+    # Sıralamaya giren (sunucuda hâlâ bulunan) kullanıcılar
+    @abstractmethod
+    async def fetch_guild_scores(self, guild_id: int):
+        ...
+    
+    # Eşitleme için sunucunun bütün kayıtları: user_id, username, reputation, departed
+    @abstractmethod
+    async def fetch_guild_members(self, guild_id: int):
+        ...
+    
+    # members: (user_id, username); yoksa oluşturur, varsa adını günceller ve geri döndürür
+    @abstractmethod
+    async def upsert_members(self, guild_id: int, members: list):
+        ...
+    
+    @abstractmethod
+    async def mark_departed(self, guild_id: int, user_ids: list):
+        ...
+    
+    @abstractmethod
+    async def fetch_history(self, user_id: int, guild_id: int, limit: int, before_id: int = None):
+        ...
+    
+    @abstractmethod
+    async def compact_history(self, retention_days: int) -> int:
+        ...
+    
+    @abstractmethod
+    async def configured_guilds(self) -> list:
+        ...
+    
+    @abstractmethod
+    async def guild_words(self, guild_id: int):
+        ...
+    
+    @abstractmethod
+    async def set_guild_word(self, guild_id: int, word: str, category: str, enabled: bool):
+        ...
+    
+    @abstractmethod
+    async def delete_guild_word(self, guild_id: int, word: str, category: str):
+        ...
+    
+    @abstractmethod
+    async def guild_settings(self, guild_id: int) -> dict:
+        ...
+    
+    @abstractmethod
+    async def set_guild_setting(self, guild_id: int, key: str, value: int):
+        ...
+
+# Kullanıcıyı oluşturan, değişiklikleri uygulayan ve yeni satırı döndüren tek ifade.
+# Reputation sınırları SQL içinde uygulanır; böylece eşzamanlı iki ceza birbirini ezmez.
+SQLITE_UPSERT_USER_SQL = """
+    INSERT INTO users (user_id, guild_id, username, reputation, total_messages, warnings, last_active)
+    VALUES (:user_id, :guild_id, :username, MAX(:min_rep, MIN(:max_rep, :start_rep + :change)),
+            :messages, :warnings, :now)
+    ON CONFLICT (user_id, guild_id) DO UPDATE SET
+        username = COALESCE(excluded.username, users.username),
+        reputation = MAX(:min_rep, MIN(:max_rep, users.reputation + :change)),
+        total_messages = users.total_messages + excluded.total_messages,
+        warnings = users.warnings + excluded.warnings,
+        last_active = MAX(IFNULL(users.last_active, ''), excluded.last_active)
+    RETURNING *
+"""
+
+# Sürümlü şema değişiklikleri. Uygulanan son sürüm PRAGMA user_version'da tutulur;
+# açılışta yalnızca daha yeni olanlar çalışır. Yeni değişiklik her zaman listenin
+# sonuna yeni bir sürüm olarak eklenir, mevcut adımlar değiştirilmez.
+SQLITE_MIGRATIONS = [
+    # 1: kullanıcılar ve reputation geçmişi
+    (1, (
+        """
             CREATE TABLE IF NOT EXISTS users (
                 user_id INTEGER,
                 guild_id INTEGER,
@@ -96,8 +463,8 @@ async def init_database():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 PRIMARY KEY (user_id, guild_id)
             )
-        """)
-        await db.execute("""
+        """,
+        """
             CREATE TABLE IF NOT EXISTS reputation_history (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
@@ -107,196 +474,2233 @@ async def init_database():
                 message_content TEXT,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
-        """)
-        await db.commit()
-        print("✅ Veritabanı hazır")
+        """,
+    )),
+    # 2: sunucuya özel kelime listeleri ve ayarlar
+    (2, (
+        """
+            CREATE TABLE IF NOT EXISTS guild_words (
+                guild_id INTEGER,
+                word TEXT,
+                category TEXT,
+                enabled INTEGER DEFAULT 1,
+                PRIMARY KEY (guild_id, word, category)
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS guild_settings (
+                guild_id INTEGER,
+                key TEXT,
+                value INTEGER,
+                PRIMARY KEY (guild_id, key)
+            )
+        """,
+    )),
+    # 3: sıralama/geçmiş indeksleri ve günlük geçmiş özetleri
+    (3, (
+        """
+            CREATE TABLE IF NOT EXISTS reputation_history_daily (
+                user_id INTEGER,
+                guild_id INTEGER,
+                day TEXT,
+                change_total INTEGER,
+                events INTEGER,
+                PRIMARY KEY (user_id, guild_id, day)
+            )
+        """,
+        """
+            CREATE INDEX IF NOT EXISTS idx_history_user
+            ON reputation_history (user_id, guild_id, id DESC)
+        """,
+        """
+            CREATE INDEX IF NOT EXISTS idx_history_created
+            ON reputation_history (created_at)
+        """,
+        """
+            CREATE INDEX IF NOT EXISTS idx_users_guild_reputation
+            ON users (guild_id, reputation DESC, user_id)
+        """,
+    )),
+    # 4: sunucudan ayrılan üyeler; sıralama yüklemesi yine yalnızca indeksi okur
+    (4, (
+        "ALTER TABLE users ADD COLUMN departed_at TIMESTAMP",
+        "DROP INDEX IF EXISTS idx_users_guild_reputation",
+        """
+            CREATE INDEX IF NOT EXISTS idx_users_guild_reputation
+            ON users (guild_id, reputation DESC, user_id, departed_at)
+        """,
+    )),
+]
 
-async def get_user(user_id: int, guild_id: int):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute(
+# Tek SQLite dosyası. Aynı makinedeki shard süreçleri de bu dosyayı paylaşabilir
+# (WAL + busy_timeout); ":memory:" ise testler için yerel bir yedek arka uçtur.
+class SQLiteStorage(Storage):
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = None
+        self.write_lock = asyncio.Lock()
+    
+    async def connect(self):
+        if self.conn is not None:
+            return
+        self.conn = await aiosqlite.connect(self.path, cached_statements=SQLITE_STATEMENT_CACHE)
+        self.conn.row_factory = aiosqlite.Row
+        for pragma in SQLITE_PRAGMAS:
+            await self.conn.execute(pragma)
+    
+    async def close(self):
+        if self.conn is None:
+            return
+        async with self.write_lock:
+            await self.conn.commit()
+            await self.conn.close()
+            self.conn = None
+    
+    async def fetchone(self, sql: str, params=()):
+        async with self.conn.execute(sql, params) as cursor:
+            return await cursor.fetchone()
+    
+    async def fetchall(self, sql: str, params=()):
+        async with self.conn.execute(sql, params) as cursor:
+            return await cursor.fetchall()
+    
+    async def execute(self, sql: str, params=()):
+        async with self.transaction() as conn:
+            await conn.execute(sql, params)
+    
+    @asynccontextmanager
+    async def transaction(self):
+        # Tek bağlantı paylaşıldığı için yazma blokları sırayla çalışır;
+        # böylece bir coroutine'in commit'i diğerinin yarım işini kapsamaz.
+        async with self.write_lock:
+            try:
+                yield self.conn
+            except BaseException:
+                await self.conn.rollback()
+                raise
+            await self.conn.commit()
+    
+    async def migrate(self) -> int:
+        async with self.transaction() as conn:
+            # IMMEDIATE: aynı dosyayı paylaşan süreçler sürümü aynı anda okuyup
+            # aynı migration'ı iki kez uygulamasın
+            await conn.execute("BEGIN IMMEDIATE")
+            async with conn.execute("PRAGMA user_version") as cursor:
+                current = (await cursor.fetchone())[0]
+            pending = [(version, statements) for version, statements in SQLITE_MIGRATIONS if version > current]
+            for version, statements in pending:
+                for sql in statements:
+                    await conn.execute(sql)
+            if pending:
+                await conn.execute(f"PRAGMA user_version = {pending[-1][0]}")
+        await self._enable_incremental_vacuum()
+        return len(pending)
+    
+    # auto_vacuum yalnızca tablolar oluşmadan önce ayarlanabilir; eski sürümün açtığı
+    # dosyalarda 0 kalır ve incremental_vacuum hiçbir şey yapmaz. Bu dosyalar bir kez
+    # VACUUM ile yeniden yazılır (transaction dışında çalışmalı), sonraki açılışlarda atlanır.
+    async def _enable_incremental_vacuum(self):
+        async with self.write_lock:
+            async with self.conn.execute("PRAGMA auto_vacuum") as cursor:
+                mode = (await cursor.fetchone())[0]
+            if mode == SQLITE_AUTO_VACUUM_INCREMENTAL:
+                return
+            print("🧹 Veritabanı artımlı vacuum'a geçiriliyor (tek seferlik VACUUM)...")
+            try:
+                await self.conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                await self.conn.execute("VACUUM")
+            except aiosqlite.OperationalError as e:
+                # Ör. başka bir süreç dosyayı kilitliyse bir sonraki açılışta tekrar denenir
+                print(f"⚠️ VACUUM yapılamadı: {e}")
+    
+    async def fetch_user(self, user_id: int, guild_id: int):
+        return await self.fetchone(
             "SELECT * FROM users WHERE user_id = ? AND guild_id = ?",
             (user_id, guild_id)
         )
-        return await cursor.fetchone()
+    
+    async def _upsert(self, conn, user_id: int, guild_id: int, username: str, change: int,
+                      warnings: int, messages: int, history: tuple):
+        async with conn.execute(SQLITE_UPSERT_USER_SQL, {
+            'user_id': user_id, 'guild_id': guild_id, 'username': username,
+            'min_rep': MIN_REPUTATION, 'max_rep': MAX_REPUTATION, 'start_rep': STARTING_REPUTATION,
+            'change': change, 'warnings': warnings, 'messages': messages, 'now': datetime.now()
+        }) as cursor:
+            row = await cursor.fetchone()
+        if history is not None:
+            reason, message_content = history
+            await conn.execute("""
+                INSERT INTO reputation_history (user_id, guild_id, change_amount, reason, message_content)
+                VALUES (?, ?, ?, ?, ?)
+            """, (user_id, guild_id, change, reason, message_content))
+        return row
+    
+    async def upsert_user(self, user_id: int, guild_id: int, username: str = None, change: int = 0,
+                          warnings: int = 0, messages: int = 0, history: tuple = None):
+        async with self.transaction() as conn:
+            return await self._upsert(conn, user_id, guild_id, username, change, warnings, messages, history)
+    
+    async def upsert_users(self, changes: list) -> list:
+        rows = []
+        async with self.transaction() as conn:
+            for user_id, guild_id, username, change, warnings, history in changes:
+                rows.append(await self._upsert(conn, user_id, guild_id, username, change, warnings, 0, history))
+        return rows
+    
+    async def add_message_counts(self, rows: list):
+        async with self.transaction() as conn:
+            # Kullanıcı yoksa burada oluşur; last_active geri gitmesin,
+            # araya giren bir ceza daha yeni bir zaman yazmış olabilir
+            await conn.executemany("""
+                INSERT INTO users (user_id, guild_id, username, reputation, total_messages, last_active)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, guild_id) DO UPDATE SET
+                    username = excluded.username,
+                    total_messages = users.total_messages + excluded.total_messages,
+                    last_active = MAX(IFNULL(users.last_active, ''), excluded.last_active)
+            """, [
+                (user_id, guild_id, username, STARTING_REPUTATION, count, last_active)
+                for user_id, guild_id, username, count, last_active in rows
+            ])
+    
+    async def fetch_guild_scores(self, guild_id: int):
+        return await self.fetchall(
+            "SELECT user_id, reputation FROM users WHERE guild_id = ? AND departed_at IS NULL", (guild_id,)
+        )
+    
+    async def fetch_guild_members(self, guild_id: int):
+        return await self.fetchall(
+            "SELECT user_id, username, reputation, departed_at IS NOT NULL AS departed FROM users WHERE guild_id = ?",
+            (guild_id,)
+        )
+    
+    async def upsert_members(self, guild_id: int, members: list):
+        async with self.transaction() as conn:
+            await conn.executemany("""
+                INSERT INTO users (user_id, guild_id, username, reputation) VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, guild_id) DO UPDATE SET
+                    username = excluded.username,
+                    departed_at = NULL
+            """, [(user_id, guild_id, username, STARTING_REPUTATION) for user_id, username in members])
+    
+    async def mark_departed(self, guild_id: int, user_ids: list):
+        now = datetime.now()
+        async with self.transaction() as conn:
+            await conn.executemany(
+                "UPDATE users SET departed_at = ? WHERE user_id = ? AND guild_id = ? AND departed_at IS NULL",
+                [(now, user_id, guild_id) for user_id in user_ids]
+            )
+    
+    async def fetch_history(self, user_id: int, guild_id: int, limit: int, before_id: int = None):
+        if before_id is None:
+            return await self.fetchall("""
+                SELECT id, change_amount, reason, created_at
+                FROM reputation_history
+                WHERE user_id = ? AND guild_id = ?
+                ORDER BY id DESC LIMIT ?
+            """, (user_id, guild_id, limit))
+        return await self.fetchall("""
+            SELECT id, change_amount, reason, created_at
+            FROM reputation_history
+            WHERE user_id = ? AND guild_id = ? AND id < ?
+            ORDER BY id DESC LIMIT ?
+        """, (user_id, guild_id, before_id, limit))
+    
+    async def compact_history(self, retention_days: int) -> int:
+        cutoff = f"-{retention_days} days"
+        moved = 0
+        while True:
+            async with self.transaction() as conn:
+                async with conn.execute("""
+                    SELECT MAX(id) FROM (
+                        SELECT id FROM reputation_history
+                        WHERE created_at < datetime('now', ?)
+                        ORDER BY created_at LIMIT ?
+                    )
+                """, (cutoff, HISTORY_COMPACT_BATCH)) as cursor:
+                    last_id = (await cursor.fetchone())[0]
+                if last_id is None:
+                    break
+                
+                await conn.execute("""
+                    INSERT INTO reputation_history_daily (user_id, guild_id, day, change_total, events)
+                    SELECT user_id, guild_id, date(created_at), SUM(change_amount), COUNT(*)
+                    FROM reputation_history
+                    WHERE id <= ? AND created_at < datetime('now', ?)
+                    GROUP BY user_id, guild_id, date(created_at)
+                    ON CONFLICT (user_id, guild_id, day) DO UPDATE SET
+                        change_total = change_total + excluded.change_total,
+                        events = events + excluded.events
+                """, (last_id, cutoff))
+                cursor = await conn.execute(
+                    "DELETE FROM reputation_history WHERE id <= ? AND created_at < datetime('now', ?)",
+                    (last_id, cutoff)
+                )
+                moved += cursor.rowcount
+                await cursor.close()
+            # Partiler arasında canlı mesaj işlemeye sıra ver
+            await asyncio.sleep(0)
+        
+        if moved:
+            async with self.write_lock:
+                # incremental_vacuum her adımda bir sayfa boşaltır; execute satır döndürmeyen
+                # ifadeyi yalnızca bir adım çalıştırır, executescript ise sonuna kadar
+                await self.conn.executescript(f"PRAGMA incremental_vacuum({HISTORY_VACUUM_PAGES});")
+        return moved
+    
+    async def configured_guilds(self) -> list:
+        rows = await self.fetchall("""
+            SELECT guild_id FROM guild_words
+            UNION SELECT guild_id FROM guild_settings
+        """)
+        return [row['guild_id'] for row in rows]
+    
+    async def guild_words(self, guild_id: int):
+        return await self.fetchall(
+            "SELECT word, category, enabled FROM guild_words WHERE guild_id = ? ORDER BY category, word",
+            (guild_id,)
+        )
+    
+    async def set_guild_word(self, guild_id: int, word: str, category: str, enabled: bool):
+        await self.execute("""
+            INSERT INTO guild_words (guild_id, word, category, enabled) VALUES (?, ?, ?, ?)
+            ON CONFLICT (guild_id, word, category) DO UPDATE SET enabled = excluded.enabled
+        """, (guild_id, word, category, 1 if enabled else 0))
+    
+    async def delete_guild_word(self, guild_id: int, word: str, category: str):
+        await self.execute(
+            "DELETE FROM guild_words WHERE guild_id = ? AND word = ? AND category = ?",
+            (guild_id, word, category)
+        )
+    
+    async def guild_settings(self, guild_id: int) -> dict:
+        rows = await self.fetchall(
+            "SELECT key, value FROM guild_settings WHERE guild_id = ?", (guild_id,)
+        )
+        return {row['key']: row['value'] for row in rows}
+    
+    async def set_guild_setting(self, guild_id: int, key: str, value: int):
+        await self.execute("""
+            INSERT INTO guild_settings (guild_id, key, value) VALUES (?, ?, ?)
+            ON CONFLICT (guild_id, key) DO UPDATE SET value = excluded.value
+        """, (guild_id, key, value))
+
+# SQLite sürümüyle aynı ifade; PostgreSQL'de MAX/MIN yerine GREATEST/LEAST kullanılır.
+# Parametre tipleri açıkça verilir, yoksa "unknown + unknown" için operatör seçilemez.
+POSTGRES_UPSERT_USER_SQL = """
+    INSERT INTO users (user_id, guild_id, username, reputation, total_messages, warnings, last_active)
+    VALUES ($1, $2, $3, GREATEST($4::INT, LEAST($5::INT, $6::INT + $7::INT)), $8, $9, $10)
+    ON CONFLICT (user_id, guild_id) DO UPDATE SET
+        username = COALESCE(excluded.username, users.username),
+        reputation = GREATEST($4::INT, LEAST($5::INT, users.reputation + $7::INT)),
+        total_messages = users.total_messages + excluded.total_messages,
+        warnings = users.warnings + excluded.warnings,
+        last_active = GREATEST(users.last_active, excluded.last_active)
+    RETURNING *
+"""
+
+# SQLITE_MIGRATIONS'ın PostgreSQL karşılığı; sürüm schema_version tablosunda tutulur
+POSTGRES_MIGRATIONS = [
+    # 1: kullanıcılar ve reputation geçmişi
+    (1, (
+        """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id BIGINT,
+                guild_id BIGINT,
+                username TEXT,
+                reputation INTEGER DEFAULT 100,
+                total_messages INTEGER DEFAULT 0,
+                warnings INTEGER DEFAULT 0,
+                last_active TIMESTAMP,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, guild_id)
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS reputation_history (
+                id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT,
+                guild_id BIGINT,
+                change_amount INTEGER,
+                reason TEXT,
+                message_content TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+    )),
+    # 2: sunucuya özel kelime listeleri ve ayarlar
+    (2, (
+        """
+            CREATE TABLE IF NOT EXISTS guild_words (
+                guild_id BIGINT,
+                word TEXT,
+                category TEXT,
+                enabled INTEGER DEFAULT 1,
+                PRIMARY KEY (guild_id, word, category)
+            )
+        """,
+        """
+            CREATE TABLE IF NOT EXISTS guild_settings (
+                guild_id BIGINT,
+                key TEXT,
+                value INTEGER,
+                PRIMARY KEY (guild_id, key)
+            )
+        """,
+    )),
+    # 3: sıralama/geçmiş indeksleri ve günlük geçmiş özetleri
+    (3, (
+        """
+            CREATE TABLE IF NOT EXISTS reputation_history_daily (
+                user_id BIGINT,
+                guild_id BIGINT,
+                day DATE,
+                change_total INTEGER,
+                events INTEGER,
+                PRIMARY KEY (user_id, guild_id, day)
+            )
+        """,
+        """
+            CREATE INDEX IF NOT EXISTS idx_history_user
+            ON reputation_history (user_id, guild_id, id DESC)
+        """,
+        """
+            CREATE INDEX IF NOT EXISTS idx_history_created
+            ON reputation_history (created_at)
+        """,
+        """
+            CREATE INDEX IF NOT EXISTS idx_users_guild_reputation
+            ON users (guild_id, reputation DESC, user_id)
+        """,
+    )),
+    # 4: sunucudan ayrılan üyeler; sıralama yüklemesi yine yalnızca indeksi okur
+    (4, (
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS departed_at TIMESTAMP",
+        "DROP INDEX IF EXISTS idx_users_guild_reputation",
+        """
+            CREATE INDEX IF NOT EXISTS idx_users_guild_reputation
+            ON users (guild_id, reputation DESC, user_id, departed_at)
+        """,
+    )),
+]
+
+# Migration sırasında süreçlerin birbirini beklemesi için advisory lock anahtarı
+POSTGRES_SCHEMA_LOCK = 7_142_001
+
+# Birden çok shard sürecinin paylaştığı PostgreSQL arka ucu (asyncpg bağlantı havuzu)
+class PostgresStorage(Storage):
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.pool = None
+    
+    async def connect(self):
+        if self.pool is not None:
+            return
+        if not ASYNCPG_AVAILABLE:
+            raise RuntimeError("DATABASE_URL PostgreSQL gösteriyor ama asyncpg yüklü değil")
+        import asyncpg
+        self.pool = await asyncpg.create_pool(
+            self.dsn, min_size=POSTGRES_POOL_MIN, max_size=POSTGRES_POOL_MAX
+        )
+    
+    async def close(self):
+        if self.pool is None:
+            return
+        await self.pool.close()
+        self.pool = None
+    
+    async def migrate(self) -> int:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Aynı anda açılan süreçler aynı migration'ı iki kez uygulamasın
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", POSTGRES_SCHEMA_LOCK)
+                await conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+                current = await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+                pending = [(version, statements) for version, statements in POSTGRES_MIGRATIONS if version > current]
+                for version, statements in pending:
+                    for sql in statements:
+                        await conn.execute(sql)
+                if pending:
+                    await conn.execute("DELETE FROM schema_version")
+                    await conn.execute("INSERT INTO schema_version (version) VALUES ($1)", pending[-1][0])
+        return len(pending)
+    
+    async def fetch_user(self, user_id: int, guild_id: int):
+        return await self.pool.fetchrow(
+            "SELECT * FROM users WHERE user_id = $1 AND guild_id = $2", user_id, guild_id
+        )
+    
+    async def _upsert(self, conn, user_id: int, guild_id: int, username: str, change: int,
+                      warnings: int, messages: int, history: tuple):
+        row = await conn.fetchrow(
+            POSTGRES_UPSERT_USER_SQL, user_id, guild_id, username,
+            MIN_REPUTATION, MAX_REPUTATION, STARTING_REPUTATION, change,
+            messages, warnings, datetime.now()
+        )
+        if history is not None:
+            reason, message_content = history
+            await conn.execute("""
+                INSERT INTO reputation_history (user_id, guild_id, change_amount, reason, message_content)
+                VALUES ($1, $2, $3, $4, $5)
+            """, user_id, guild_id, change, reason, message_content)
+        return row
+    
+    async def upsert_user(self, user_id: int, guild_id: int, username: str = None, change: int = 0,
+                          warnings: int = 0, messages: int = 0, history: tuple = None):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                return await self._upsert(conn, user_id, guild_id, username, change, warnings, messages, history)
+    
+    async def upsert_users(self, changes: list) -> list:
+        rows = []
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                for user_id, guild_id, username, change, warnings, history in changes:
+                    rows.append(await self._upsert(conn, user_id, guild_id, username, change, warnings, 0, history))
+        return rows
+    
+    async def add_message_counts(self, rows: list):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany("""
+                    INSERT INTO users (user_id, guild_id, username, reputation, total_messages, last_active)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                    ON CONFLICT (user_id, guild_id) DO UPDATE SET
+                        username = excluded.username,
+                        total_messages = users.total_messages + excluded.total_messages,
+                        last_active = GREATEST(users.last_active, excluded.last_active)
+                """, [
+                    (user_id, guild_id, username, STARTING_REPUTATION, count, last_active)
+                    for user_id, guild_id, username, count, last_active in rows
+                ])
+    
+    async def fetch_guild_scores(self, guild_id: int):
+        return await self.pool.fetch(
+            "SELECT user_id, reputation FROM users WHERE guild_id = $1 AND departed_at IS NULL", guild_id
+        )
+    
+    async def fetch_guild_members(self, guild_id: int):
+        return await self.pool.fetch(
+            "SELECT user_id, username, reputation, departed_at IS NOT NULL AS departed FROM users WHERE guild_id = $1",
+            guild_id
+        )
+    
+    async def upsert_members(self, guild_id: int, members: list):
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany("""
+                    INSERT INTO users (user_id, guild_id, username, reputation) VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (user_id, guild_id) DO UPDATE SET
+                        username = excluded.username,
+                        departed_at = NULL
+                """, [(user_id, guild_id, username, STARTING_REPUTATION) for user_id, username in members])
+    
+    async def mark_departed(self, guild_id: int, user_ids: list):
+        now = datetime.now()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany(
+                    "UPDATE users SET departed_at = $1 WHERE user_id = $2 AND guild_id = $3 AND departed_at IS NULL",
+                    [(now, user_id, guild_id) for user_id in user_ids]
+                )
+    
+    async def fetch_history(self, user_id: int, guild_id: int, limit: int, before_id: int = None):
+        # created_at, SQLite'taki gibi metin olarak döner
+        return await self.pool.fetch("""
+            SELECT id, change_amount, reason, to_char(created_at, 'YYYY-MM-DD HH24:MI:SS') AS created_at
+            FROM reputation_history
+            WHERE user_id = $1 AND guild_id = $2 AND ($3::BIGINT IS NULL OR id < $3)
+            ORDER BY id DESC LIMIT $4
+        """, user_id, guild_id, before_id, limit)
+    
+    async def compact_history(self, retention_days: int) -> int:
+        moved = 0
+        while True:
+            # Seçme, taşıma ve silme tek ifadede; SKIP LOCKED sayesinde aynı anda
+            # çalışan başka bir süreç aynı satırları ikinci kez özetlemez
+            count = await self.pool.fetchval("""
+                WITH doomed AS (
+                    SELECT id FROM reputation_history
+                    WHERE created_at < LOCALTIMESTAMP - make_interval(days => $1)
+                    ORDER BY created_at LIMIT $2
+                    FOR UPDATE SKIP LOCKED
+                ), removed AS (
+                    DELETE FROM reputation_history h USING doomed
+                    WHERE h.id = doomed.id
+                    RETURNING h.user_id, h.guild_id, h.change_amount, h.created_at
+                ), summarized AS (
+                    INSERT INTO reputation_history_daily (user_id, guild_id, day, change_total, events)
+                    SELECT user_id, guild_id, created_at::DATE, SUM(change_amount), COUNT(*)
+                    FROM removed
+                    GROUP BY user_id, guild_id, created_at::DATE
+                    ON CONFLICT (user_id, guild_id, day) DO UPDATE SET
+                        change_total = reputation_history_daily.change_total + excluded.change_total,
+                        events = reputation_history_daily.events + excluded.events
+                )
+                SELECT COUNT(*) FROM removed
+            """, retention_days, HISTORY_COMPACT_BATCH)
+            if not count:
+                break
+            moved += count
+            await asyncio.sleep(0)
+        # Boşalan alanı PostgreSQL'de autovacuum geri kazanır
+        return moved
+    
+    async def configured_guilds(self) -> list:
+        rows = await self.pool.fetch("""
+            SELECT guild_id FROM guild_words
+            UNION SELECT guild_id FROM guild_settings
+        """)
+        return [row['guild_id'] for row in rows]
+    
+    async def guild_words(self, guild_id: int):
+        return await self.pool.fetch(
+            "SELECT word, category, enabled FROM guild_words WHERE guild_id = $1 ORDER BY category, word",
+            guild_id
+        )
+    
+    async def set_guild_word(self, guild_id: int, word: str, category: str, enabled: bool):
+        await self.pool.execute("""
+            INSERT INTO guild_words (guild_id, word, category, enabled) VALUES ($1, $2, $3, $4)
+            ON CONFLICT (guild_id, word, category) DO UPDATE SET enabled = excluded.enabled
+        """, guild_id, word, category, 1 if enabled else 0)
+    
+    async def delete_guild_word(self, guild_id: int, word: str, category: str):
+        await self.pool.execute(
+            "DELETE FROM guild_words WHERE guild_id = $1 AND word = $2 AND category = $3",
+            guild_id, word, category
+        )
+    
+    async def guild_settings(self, guild_id: int) -> dict:
+        rows = await self.pool.fetch(
+            "SELECT key, value FROM guild_settings WHERE guild_id = $1", guild_id
+        )
+        return {row['key']: row['value'] for row in rows}
+    
+    async def set_guild_setting(self, guild_id: int, key: str, value: int):
+        await self.pool.execute("""
+            INSERT INTO guild_settings (guild_id, key, value) VALUES ($1, $2, $3)
+            ON CONFLICT (guild_id, key) DO UPDATE SET value = excluded.value
+        """, guild_id, key, value)
+
+# DATABASE_URL bir PostgreSQL adresiyse ortak arka uç, değilse yerel SQLite dosyası
+def create_storage() -> Storage:
+    if DATABASE_URL.startswith(('postgres://', 'postgresql://')):
+        return PostgresStorage(DATABASE_URL)
+    return SQLiteStorage(DATABASE_PATH)
+
+# Mesaj sayaçları her mesajda değil, toplu olarak yazılır
+MESSAGE_FLUSH_INTERVAL = 5.0      # saniye
+MESSAGE_FLUSH_MAX_PENDING = 500   # bu kadar kullanıcı birikince beklemeden yaz
+
+# total_messages / last_active güncellemelerini bellekte biriktirip
+# tek transaction'da yazan write-behind tampon
+class MessageCounterBuffer:
+    def __init__(self, interval: float, max_pending: int):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.pending = {}  # (user_id, guild_id) -> [mesaj sayısı, son aktiflik, kullanıcı adı]
+        self._flushing = {}  # şu an yazılmakta olan tur
+        self._wake = asyncio.Event()
+        self._task = None
+    
+    def add(self, user_id: int, guild_id: int, username: str):
+        key = (user_id, guild_id)
+        entry = self.pending.get(key)
+        if entry is None:
+            self.pending[key] = [1, datetime.now(), username]
+        else:
+            entry[0] += 1
+            entry[1] = datetime.now()
+            entry[2] = username
+        user_cache.record_message(user_id, guild_id, username)
+        if len(self.pending) >= self.max_pending:
+            self._wake.set()
+    
+    def pending_count(self, user_id: int, guild_id: int) -> int:
+        key = (user_id, guild_id)
+        entry = self.pending.get(key)
+        flushing = self._flushing.get(key)
+        return (entry[0] if entry else 0) + (flushing[0] if flushing else 0)
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"❌ Mesaj sayaçları yazılamadı: {e}")
+    
+    @timed('db.flush_messages')
+    async def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, {}
+        self._flushing = batch
+        rows = [
+            (user_id, guild_id, username, count, last_active)
+            for (user_id, guild_id), (count, last_active, username) in batch.items()
+        ]
+        try:
+            await database.add_message_counts(rows)
+        except Exception:
+            # Yazılamayan sayaçları kaybetme, bir sonraki turda tekrar dene
+            for key, (count, last_active, username) in batch.items():
+                entry = self.pending.get(key)
+                if entry is None:
+                    self.pending[key] = [count, last_active, username]
+                else:
+                    entry[0] += count
+            raise
+        else:
+            # Bu turda oluşan kullanıcılar başlangıç puanıyla sıralamaya girer
+            for user_id, guild_id in batch:
+                leaderboards.add_if_missing(guild_id, user_id, STARTING_REPUTATION)
+        finally:
+            self._flushing = {}
+
+# Bellekte tutulan en fazla kullanıcı kaydı (tüm sunucular toplamı)
+USER_CACHE_SIZE = 50_000
+
+# users tablosundaki bir satırın önbellekteki hali; satır gibi ['alan'] ile okunur
+class CachedUser:
+    __slots__ = ('user_id', 'guild_id', 'username', 'reputation', 'total_messages', 'warnings')
+    
+    def __init__(self, row):
+        for field in self.__slots__:
+            setattr(self, field, row[field])
+    
+    def __getitem__(self, field: str):
+        return getattr(self, field)
+
+# users tablosunun önünde duran, LRU ile sınırlandırılmış write-through önbellek.
+# Bir sunucunun olayları yalnızca o sunucunun shard'ını çalıştıran süreçte işlendiği için
+# bir (user_id, guild_id) satırının tek yazarı bu süreçtir; DB'ye giden her güncelleme
+# buraya da yansıtılır.
+class UserCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # (user_id, guild_id) -> CachedUser
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, user_id: int, guild_id: int):
+        key = (user_id, guild_id)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+    
+    def put(self, row) -> CachedUser:
+        entry = CachedUser(row)
+        # DB'ye henüz yazılmamış mesaj sayaçlarını da göster
+        entry.total_messages += message_counters.pending_count(entry.user_id, entry.guild_id)
+        key = (entry.user_id, entry.guild_id)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+        return entry
+    
+    def record_message(self, user_id: int, guild_id: int, username: str):
+        entry = self.entries.get((user_id, guild_id))
+        if entry is not None:
+            entry.total_messages += 1
+            entry.username = username
+    
+    def rename(self, user_id: int, guild_id: int, username: str):
+        entry = self.entries.get((user_id, guild_id))
+        if entry is not None:
+            entry.username = username
+    
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+# Bir sunucunun reputation sıralaması. Puanlar MIN..MAX arasında tam sayı olduğu için
+# puan başına kullanıcı sayısı bir Fenwick ağacında tutulur; hem "ilk N" hem de
+# "kaçıncıyım" sorguları O(log n) ile cevaplanır.
+class GuildLeaderboard:
+    def __init__(self):
+        self.size = MAX_REPUTATION - MIN_REPUTATION + 1
+        self.tree = [0] * (self.size + 1)
+        self.scores = {}   # user_id -> reputation
+        self.buckets = {}  # reputation -> {user_id}
+    
+    def _index(self, reputation: int) -> int:
+        # 1. indeks en yüksek puan olacak şekilde ters çevrilir
+        return MAX_REPUTATION - reputation + 1
+    
+    def _add(self, reputation: int, delta: int):
+        i = self._index(reputation)
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+    
+    def _count_above(self, reputation: int) -> int:
+        i = self._index(reputation) - 1
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+    
+    def _kth(self, k: int) -> int:
+        # k. sıradaki kullanıcının puanı (Fenwick üzerinde ikili arama)
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = position + step
+            if nxt <= self.size and self.tree[nxt] < k:
+                position = nxt
+                k -= self.tree[nxt]
+            step >>= 1
+        return MAX_REPUTATION - position
+    
+    def set(self, user_id: int, reputation: int):
+        old = self.scores.get(user_id)
+        if old == reputation:
+            return
+        if old is not None:
+            self._discard(user_id, old)
+        self.scores[user_id] = reputation
+        self.buckets.setdefault(reputation, set()).add(user_id)
+        self._add(reputation, 1)
+    
+    def remove(self, user_id: int):
+        old = self.scores.pop(user_id, None)
+        if old is not None:
+            self._discard(user_id, old)
+    
+    def _discard(self, user_id: int, reputation: int):
+        bucket = self.buckets[reputation]
+        bucket.discard(user_id)
+        if not bucket:
+            del self.buckets[reputation]
+        self._add(reputation, -1)
+    
+    def rank(self, user_id: int):
+        reputation = self.scores.get(user_id)
+        if reputation is None:
+            return None
+        return self._count_above(reputation) + 1
+    
+    def top(self, limit: int) -> list:
+        result = []
+        k = 1
+        while len(result) < limit and k <= len(self.scores):
+            reputation = self._kth(k)
+            bucket = self.buckets[reputation]
+            for user_id in itertools.islice(bucket, limit - len(result)):
+                result.append((user_id, reputation))
+            k += len(bucket)
+        return result
+
+# Sunucu sıralamaları ilk ihtiyaç duyulduğunda (guild_id, reputation) indeksinden
+# bir kez yüklenir, sonrasında reputation değişiklikleriyle güncel tutulur.
+class Leaderboards:
+    def __init__(self):
+        self.boards = {}
+        self.loading = {}  # guild_id -> yükleme görevi
+    
+    async def get(self, guild_id: int) -> GuildLeaderboard:
+        board = self.boards.get(guild_id)
+        if board is not None and guild_id not in self.loading:
+            return board
+        task = self.loading.get(guild_id)
+        if task is None:
+            task = asyncio.ensure_future(self._load(guild_id))
+            self.loading[guild_id] = task
+        return await asyncio.shield(task)
+    
+    async def _load(self, guild_id: int) -> GuildLeaderboard:
+        # Yükleme sürerken gelen güncellemeler de tahtaya işlenir; okunan satırlar
+        # yalnızca tahtada olmayan kullanıcılar için kullanılır, böylece daha yeni
+        # değerler ezilmez
+        board = GuildLeaderboard()
+        self.boards[guild_id] = board
+        try:
+            rows = await database.fetch_guild_scores(guild_id)
+            for row in rows:
+                if row['user_id'] not in board.scores:
+                    board.set(row['user_id'], row['reputation'])
+            return board
+        except BaseException:
+            del self.boards[guild_id]
+            raise
+        finally:
+            del self.loading[guild_id]
+    
+    def update(self, guild_id: int, user_id: int, reputation: int):
+        board = self.boards.get(guild_id)
+        if board is not None:
+            board.set(user_id, reputation)
+    
+    def add_if_missing(self, guild_id: int, user_id: int, reputation: int):
+        board = self.boards.get(guild_id)
+        if board is not None and user_id not in board.scores:
+            board.set(user_id, reputation)
+    
+    def remove(self, guild_id: int, user_id: int):
+        board = self.boards.get(guild_id)
+        if board is not None:
+            board.remove(user_id)
+    
+    def discard_guild(self, guild_id: int):
+        self.boards.pop(guild_id, None)
+
+database = create_storage()
+user_cache = UserCache(USER_CACHE_SIZE)
+leaderboards = Leaderboards()
+message_counters = MessageCounterBuffer(MESSAGE_FLUSH_INTERVAL, MESSAGE_FLUSH_MAX_PENDING)
+
+async def init_database():
+    await database.connect()
+    applied = await database.migrate()
+    if applied:
+        print(f"✅ Veritabanı hazır ({applied} migration uygulandı)")
+    else:
+        print("✅ Veritabanı hazır")
+
+@timed('db.get_user')
+async def get_user(user_id: int, guild_id: int):
+    cached = user_cache.get(user_id, guild_id)
+    if cached is not None:
+        return cached
+    row = await database.fetch_user(user_id, guild_id)
+    return user_cache.put(row) if row else None
+
+# DB'den dönen güncel satırı önbelleğe ve sıralamaya yansıt
+def _remember_user(row) -> CachedUser:
+    if row['departed_at'] is None:
+        leaderboards.update(row['guild_id'], row['user_id'], row['reputation'])
+    return user_cache.put(row)
+
+@timed('db.upsert_user')
+async def upsert_user(user_id: int, guild_id: int, username: str = None,
+                      change: int = 0, warnings: int = 0, messages: int = 0):
+    row = await database.upsert_user(user_id, guild_id, username, change, warnings, messages)
+    return _remember_user(row)
 
 async def create_user(user_id: int, guild_id: int, username: str):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("""
-            INSERT OR IGNORE INTO users (user_id, guild_id, username, reputation, last_active)
-            VALUES (?, ?, ?, ?, ?)
-        """, (user_id, guild_id, username, STARTING_REPUTATION, datetime.now()))
-        await db.commit()
-
-async def update_reputation(user_id: int, guild_id: int, change: int, reason: str, message_content: str = None):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        cursor = await db.execute(
-            "SELECT reputation FROM users WHERE user_id = ? AND guild_id = ?",
-            (user_id, guild_id)
+    return await upsert_user(user_id, guild_id, username)
+
+@timed('db.update_reputation')
+async def update_reputation(user_id: int, guild_id: int, change: int, reason: str, message_content: str = None,
+                            username: str = None, warning: bool = False):
+    row = await database.upsert_user(
+        user_id, guild_id, username, change, 1 if warning else 0,
+        history=(reason, message_content[:500] if message_content else None)
+    )
+    return _remember_user(row).reputation
+
+# Bir mesaj grubunun bütün cezaları tek transaction'da, verilen sırayla uygulanır.
+# changes: (user_id, guild_id, change, reason, message_content, username, warning)
+@timed('db.update_reputations')
+async def update_reputations(changes: list) -> list:
+    rows = await database.upsert_users([
+        (user_id, guild_id, username, change, 1 if warning else 0,
+         (reason, message_content[:500] if message_content else None))
+        for user_id, guild_id, change, reason, message_content, username, warning in changes
+    ])
+    return [_remember_user(row).reputation for row in rows]
+
+async def get_guild_members(guild_id: int):
+    return await database.fetch_guild_members(guild_id)
+
+@timed('db.upsert_members')
+async def upsert_members(guild_id: int, members: list):
+    await database.upsert_members(guild_id, members)
+    for user_id, username in members:
+        user_cache.rename(user_id, guild_id, username)
+
+# Ayrılan üyeler kayıtlarıyla birlikte kalır ama sıralamadan çıkar
+@timed('db.mark_departed')
+async def mark_departed(guild_id: int, user_ids: list):
+    await database.mark_departed(guild_id, user_ids)
+    for user_id in user_ids:
+        leaderboards.remove(guild_id, user_id)
+
+# Sunucuya katılan (ya da geri dönen) üye; eski puanıyla sıralamaya geri girer
+async def add_member(user_id: int, guild_id: int, username: str):
+    await upsert_members(guild_id, [(user_id, username)])
+    return _remember_user(await database.fetch_user(user_id, guild_id))
+
+async def increment_warnings(user_id: int, guild_id: int):
+    await upsert_user(user_id, guild_id, warnings=1)
+
+def increment_messages(user_id: int, guild_id: int, username: str):
+    message_counters.add(user_id, guild_id, username)
+
+@timed('db.get_leaderboard')
+async def get_leaderboard(guild_id: int, limit: int = 10):
+    board = await leaderboards.get(guild_id)
+    leaders = []
+    for user_id, _ in board.top(limit):
+        user = await get_user(user_id, guild_id)
+        if user:
+            leaders.append(user)
+    return leaders
+
+@timed('db.get_rank')
+async def get_rank(user_id: int, guild_id: int):
+    board = await leaderboards.get(guild_id)
+    return board.rank(user_id), len(board.scores)
+
+# Keyset sayfalama: bir sonraki sayfa için son satırın id'si before_id olarak verilir
+@timed('db.get_user_history')
+async def get_user_history(user_id: int, guild_id: int, limit: int = 10, before_id: int = None):
+    return await database.fetch_history(user_id, guild_id, limit, before_id)
+
+@timed('db.compact_reputation_history')
+async def compact_reputation_history(retention_days: int = HISTORY_RETENTION_DAYS) -> int:
+    return await database.compact_history(retention_days)
+
+async def get_configured_guilds():
+    return await database.configured_guilds()
+
+async def get_guild_words(guild_id: int):
+    return await database.guild_words(guild_id)
+
+async def set_guild_word(guild_id: int, word: str, category: str, enabled: bool):
+    await database.set_guild_word(guild_id, word, category, enabled)
+
+async def delete_guild_word(guild_id: int, word: str, category: str):
+    await database.delete_guild_word(guild_id, word, category)
+
+async def get_guild_settings(guild_id: int) -> dict:
+    return await database.guild_settings(guild_id)
+
+async def set_guild_setting(guild_id: int, key: str, value: int):
+    await database.set_guild_setting(guild_id, key, value)
+
+# ==================== KÜFÜR ALGILAMA ====================
+
+# Leetspeak ve ayraç karakterlerinin karşılıkları
+CHAR_REPLACEMENTS = {
+    '4': 'a', '@': 'a', '0': 'o', '1': 'i', '!': 'i',
+    '3': 'e', '$': 's', '5': 's', '7': 't', '+': 't',
+    '*': '', '.': '', '-': '', '_': ''
+}
+
+# Latin harflerine benzeyen Kiril/Yunan karakterleri
+CONFUSABLES = {
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h',
+    'о': 'o', 'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'і': 'i',
+    'ј': 'j', 'ѕ': 's', 'ԁ': 'd', 'ɡ': 'g', 'α': 'a', 'β': 'b', 'ε': 'e',
+    'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p', 'τ': 't', 'υ': 'u', 'χ': 'x'
+}
+
+# Aksanı atılmayacak Türkçe harfler
+TURKISH_LETTERS = frozenset('çğıöşü')
+
+# Tabloya önceden işlenen bloklar: Latin, Yunan, Kiril, harf benzeri semboller,
+# tam genişlik ve matematiksel alfanümerik karakterler. Diğerleri olduğu gibi kalır.
+FOLD_RANGES = (
+    (0x0000, 0x0530), (0x1E00, 0x1F00), (0x2100, 0x2150),
+    (0xFF00, 0xFFF0), (0x1D400, 0x1D800)
+)
+
+REPEATED_CHAR_RE = re.compile(r'(.)\1\1+')
+
+# Türkçe büyük/küçük harf kuralı: I -> ı, İ -> i (str.lower İ'yi iki karaktere böler,
+# I'yı da i yapar; "SIK" ile "sık" aynı kelimedir, "sik" değil)
+TURKISH_CASE = {'I': 'ı', 'İ': 'i'}
+
+def fold_char(ch: str) -> str:
+    if ch in TURKISH_CASE:
+        return TURKISH_CASE[ch]
+    ch = ch.lower()
+    if ch.isascii() or ch in TURKISH_LETTERS:
+        return ch
+    ch = CONFUSABLES.get(ch, ch)
+    # Tam genişlik/matematiksel harfleri sadeleştir, Türkçe dışı aksanları at
+    folded = ''.join(c for c in unicodedata.normalize('NFKD', ch) if not unicodedata.combining(c))
+    return folded.lower()
+
+# str.translate için tek geçişlik tablo. Eşlenmeyen karakterde KeyError
+# oluşmasın diye bloklardaki her karakter (değişmeyenler dahil) tabloya yazılır.
+def build_fold_table(replacements: dict) -> dict:
+    table = {}
+    for start, end in FOLD_RANGES:
+        for codepoint in range(start, end):
+            table[codepoint] = fold_char(chr(codepoint))
+    table.update(str.maketrans(replacements))
+    return table
+
+# Kelime listeleri yalnızca harf katlamasından geçer; mesajlar ayrıca leetspeak çözümlemesinden
+LETTER_FOLD_TABLE = build_fold_table({})
+NORMALIZE_TABLE = build_fold_table(CHAR_REPLACEMENTS)
+# ASCII klavyeyle büyük yazılan "SIKTIR", "IBNE" kelimelerinde I aslında i'dir;
+# büyük I içeren mesajlar bu tabloyla bir kez daha taranır
+ASCII_I_NORMALIZE_TABLE = {**NORMALIZE_TABLE, ord('I'): 'i'}
+
+def fold_word(word: str) -> str:
+    return word.translate(LETTER_FOLD_TABLE)
+
+# Listedeki yazım ve ı'ları i'ye çevrilmiş hali ("gerizekalı" -> "gerizekali") aranır.
+# Tersine (i -> ı) çevrilmez: "sik" anahtarı günlük "sık" kelimesini yakalardı.
+def match_keys(word: str) -> set:
+    key = fold_word(word)
+    return {key, key.replace('ı', 'i')}
+
+# Tüm kelime listelerini metin üzerinde tek geçişte arayan Aho–Corasick otomatı.
+# Her eşleşme (kelime, kategori) olarak döner; liste büyüse de mesaj başı maliyet
+# metnin uzunluğuyla orantılı kalır.
+class PatternMatcher:
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for key, word, category in patterns:
+            self._insert(key, (word, category))
+        self._link()
+    
+    def _insert(self, pattern: str, payload: tuple):
+        node = 0
+        for ch in pattern:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(())
+                self.goto[node][ch] = nxt
+            node = nxt
+        if payload not in self.out[node]:
+            self.out[node] += (payload,)
+    
+    def _link(self):
+        # Başarısızlık bağlantılarını geçiş tablosuna katlayarak her karakteri
+        # tek sözlük aramasıyla ilerleyen bir DFA kur
+        self.delta = [dict(self.goto[0])] + [None] * (len(self.goto) - 1)
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for ch, child in self.goto[node].items():
+                self.fail[child] = self.delta[self.fail[node]].get(ch, 0)
+                self.out[child] += self.out[self.fail[child]]
+                queue.append(child)
+            self.delta[node] = {**self.delta[self.fail[node]], **self.goto[node]}
+    
+    def find(self, text: str):
+        delta, out = self.delta, self.out
+        node = 0
+        for ch in text:
+            node = delta[node].get(ch, 0)
+            if out[node]:
+                yield from out[node]
+
+# Varsayılan kelime listeleri, kategoriye göre
+DEFAULT_WORD_LISTS = {
+    'profanity': frozenset(word.lower() for word in TURKISH_PROFANITY),
+    'insult': frozenset(word.lower() for word in INSULT_PATTERNS),
+    'severe': frozenset(word.lower() for word in SEVERE_WORDS)
+}
+
+# Varsayılan kelimelerin eşleşme anahtarlarından listedeki yazımlarına;
+# "/filtre sil GERIZEKALI" da varsayılan "gerizekalı"yı bulur
+DEFAULT_WORD_KEYS = {
+    category: {key: word for word in words for key in match_keys(word)}
+    for category, words in DEFAULT_WORD_LISTS.items()
+}
+
+# Sunucuya özel kelimeler mesajlarla aynı normalleştirmeden geçer ("k0d" -> "kod");
+# yoksa rakam ya da . - _ * içeren kelimeler hiçbir mesajla eşleşmez.
+# Varsayılan bir kelimeye denk gelenler, kapatılıp açılabilsin diye listedeki yazımıyla döner.
+def normalize_guild_word(word: str, category: str) -> str:
+    defaults = DEFAULT_WORD_KEYS[category]
+    for key in match_keys(word):
+        if key in defaults:
+            return defaults[key]
+    return REPEATED_CHAR_RE.sub(r'\1\1', word.translate(NORMALIZE_TABLE))
+
+# Her derlenmiş dedektöre verilen benzersiz sürüm; işçi süreçler önbelleklerini buna göre tutar
+DETECTOR_VERSIONS = itertools.count()
+
+class ProfanityDetector:
+    def __init__(self, word_lists: dict = None, settings: dict = None):
+        self.version = next(DETECTOR_VERSIONS)
+        self.word_lists = word_lists
+        word_lists = word_lists or DEFAULT_WORD_LISTS
+        self.settings = settings or DEFAULT_GUILD_SETTINGS
+        self.profanity_list = set(word_lists['profanity'])
+        self.matcher = PatternMatcher(
+            (key, word, category)
+            for category, words in word_lists.items()
+            for word in words
+            for key in match_keys(word)
         )
-        result = await cursor.fetchone()
+    
+    def _normalize_text(self, text: str, table: dict = NORMALIZE_TABLE) -> str:
+        return REPEATED_CHAR_RE.sub(r'\1\1', text.translate(table))
+    
+    def _find(self, message: str):
+        yield from self.matcher.find(self._normalize_text(message))
+        if 'I' in message:
+            yield from self.matcher.find(self._normalize_text(message, ASCII_I_NORMALIZE_TABLE))
+    
+    def check(self, message: str) -> dict:
         
-        if result:
-            current_rep = result[0]
-            new_rep = max(MIN_REPUTATION, min(MAX_REPUTATION, current_rep + change))
-            
-            await db.execute("""
-                UPDATE users SET reputation = ?, last_active = ?
-                WHERE user_id = ? AND guild_id = ?
-            """, (new_rep, datetime.now(), user_id, guild_id))
-            
-            await db.execute("""
-                INSERT INTO reputation_history (user_id, guild_id, change_amount, reason, message_content)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user_id, guild_id, change, reason, message_content[:500] if message_content else None))
-            
-            await db.commit()
-            return new_rep
-    return None
+        matched_words = []
+        has_profanity = False
+        has_insult = False
+        is_severe = False
+        severity = 'clean'
+        penalty = 0
+        
+        for word, category in self._find(message):
+            if category == 'severe':
+                is_severe = True
+                continue
+            if category == 'profanity':
+                has_profanity = True
+            else:
+                has_insult = True
+            if word not in matched_words:
+                matched_words.append(word)
+        
+        if has_profanity or has_insult:
+            if is_severe:
+                severity = 'severe'
+                penalty = self.settings['severe_penalty']
+            elif has_insult:
+                severity = 'moderate'
+                penalty = self.settings['insult_penalty']
+            else:
+                severity = 'mild'
+                penalty = self.settings['profanity_penalty']
+        
+        return {
+            'has_profanity': has_profanity,
+            'has_insult': has_insult,
+            'severity': severity,
+            'matched_words': matched_words,
+            'penalty': penalty
+        }
+
+# Sunucu başına derlenmiş dedektörler. Özelleştirme yapmamış sunucular ortak
+# varsayılan dedektörü kullanır; bir sunucunun listesi değişince yalnızca onunki
+# yeniden derlenir. Mesaj yolunda hiçbir zaman derleme yapılmaz.
+class GuildFilters:
+    def __init__(self):
+        self.default = ProfanityDetector()
+        self.detectors = {}
+    
+    def get(self, guild_id: int) -> ProfanityDetector:
+        return self.detectors.get(guild_id, self.default)
+    
+    async def load_all(self):
+        for guild_id in await get_configured_guilds():
+            await self.reload(guild_id)
+    
+    async def reload(self, guild_id: int):
+        words = await get_guild_words(guild_id)
+        settings = await get_guild_settings(guild_id)
+        if not words and not settings:
+            self.detectors.pop(guild_id, None)
+            return
+        
+        word_lists = {category: set(words) for category, words in DEFAULT_WORD_LISTS.items()}
+        for row in words:
+            category = row['category']
+            word = normalize_guild_word(row['word'], category)
+            if row['enabled']:
+                word_lists[category].add(word)
+                # Ağır kelimeler tek başına eşleşmez, yalnızca cezayı büyütür;
+                # sunucunun eklediği ağır kelime küfür olarak da aranır
+                if category == 'severe' and word not in DEFAULT_WORD_LISTS['severe']:
+                    word_lists['profanity'].add(word)
+            else:
+                word_lists[category].discard(word)
+        
+        self.detectors[guild_id] = ProfanityDetector(word_lists, {**DEFAULT_GUILD_SETTINGS, **settings})
+
+# Uzun mesajların kontrolü event loop yerine bir işçi havuzunda yapılır.
+# "thread": aynı süreçte iş parçacıkları (loop GIL'i düzenli aralıklarla geri alır),
+# "process": ayrı süreçler (gerçek paralellik), "off": her şey satır içinde.
+DETECTION_OFFLOAD = os.getenv('DETECTION_OFFLOAD', 'thread')
+DETECTION_WORKERS = int(os.getenv('DETECTION_WORKERS', '2'))
+DETECTION_OFFLOAD_MIN_CHARS = 500   # bundan uzun mesajlar havuza gider
+DETECTION_BUSY_MIN_CHARS = 100      # loop gecikirken bu eşik kullanılır
+DETECTION_BUSY_LAG = 0.05           # saniye; metrics.loop_lag bunu aşarsa "yük altında"
+DETECTION_WORKER_CACHE = 64         # işçi süreç başına tutulan sunucu dedektörü
+
+# İşçi süreçlerdeki dedektörler. Varsayılan dedektör süreç açılırken bir kez derlenir;
+# sunucuya özel olanlar ilk kullanımda derlenip sürümüyle saklanır. Her çağrıda yalnızca
+# sürüm ve mesaj gönderilir; kelime listeleri bir işçiye sürüm başına bir kez gider.
+_worker_default = None
+_worker_detectors = OrderedDict()
+
+def _init_detection_worker(default_version: int):
+    global _worker_default
+    _worker_default = (default_version, ProfanityDetector())
+
+# İşçi sürümü tanımıyorsa None döner; ana süreç o zaman listelerle _compile_in_worker'ı çağırır
+def _check_in_worker(version: int, content: str):
+    if _worker_default is not None and version == _worker_default[0]:
+        return _worker_default[1].check(content)
+    detector = _worker_detectors.get(version)
+    if detector is None:
+        return None
+    _worker_detectors.move_to_end(version)
+    return detector.check(content)
+
+def _compile_in_worker(version: int, word_lists: dict, settings: dict, content: str) -> dict:
+    detector = ProfanityDetector(word_lists, settings)
+    _worker_detectors[version] = detector
+    if len(_worker_detectors) > DETECTION_WORKER_CACHE:
+        _worker_detectors.popitem(last=False)
+    return detector.check(content)
+
+# Kısa mesajlar satır içinde kalır; uzunlar (ya da loop gecikirken orta boylar) havuza gider
+class DetectionPool:
+    def __init__(self, mode: str, workers: int):
+        self.mode = mode
+        self.workers = workers
+        self.executor = None
+    
+    def start(self, default_detector: ProfanityDetector):
+        if self.executor is not None or self.mode == 'off':
+            return
+        if self.mode == 'process':
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_detection_worker,
+                initargs=(default_detector.version,)
+            )
+        else:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='detection'
+            )
+    
+    def stop(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+    
+    def threshold(self) -> int:
+        if metrics.loop_lag > DETECTION_BUSY_LAG:
+            return DETECTION_BUSY_MIN_CHARS
+        return DETECTION_OFFLOAD_MIN_CHARS
+    
+    async def check(self, detector: ProfanityDetector, content: str) -> dict:
+        if self.executor is None or len(content) < self.threshold():
+            return detector.check(content)
+        
+        metrics.inc('detection_offloaded')
+        loop = asyncio.get_running_loop()
+        try:
+            if self.mode == 'process':
+                result = await loop.run_in_executor(self.executor, _check_in_worker, detector.version, content)
+                if result is None:
+                    metrics.inc('detection_worker_compiles')
+                    result = await loop.run_in_executor(
+                        self.executor, _compile_in_worker,
+                        detector.version, detector.word_lists, detector.settings, content
+                    )
+                return result
+            return await loop.run_in_executor(self.executor, detector.check, content)
+        except concurrent.futures.BrokenExecutor as e:
+            # Çöken havuz yüzünden mesaj denetimsiz kalmasın
+            print(f"❌ Algılama havuzu çöktü, satır içinde devam ediliyor: {e}")
+            self.executor = None
+            return detector.check(content)
+
+# ==================== SPAM ALGILAMA ====================
+
+FLOOD_WINDOW = 10           # saniye
+FLOOD_MAX_MESSAGES = 8      # pencere içinde kanal başına en fazla mesaj
+FLOOD_MAX_DUPLICATES = 4    # pencere içinde aynı içerikli en fazla mesaj
+FLOOD_MAX_MENTIONS = 10     # pencere içinde toplam en fazla etiket
+FLOOD_COOLDOWN = 30         # yakalandıktan sonra bu süre içinde tekrar ceza verilmez
+FLOOD_TRACKER_MAX = 20_000  # bellekte tutulan en fazla (sunucu, kullanıcı, kanal)
+
+# Tek bir (sunucu, kullanıcı, kanal) için son mesajların sabit boyutlu halka tamponu.
+# İçerik özetleri ve etiket toplamı tampona girip çıkarken güncellenir, böylece
+# her mesaj O(1) maliyetle değerlendirilir.
+class RateTracker:
+    __slots__ = ('events', 'content_counts', 'mentions', 'cooldown_until')
+    
+    def __init__(self):
+        self.events = deque()      # (zaman, içerik özeti, etiket sayısı)
+        self.content_counts = {}
+        self.mentions = 0
+        self.cooldown_until = 0.0
+    
+    def _evict(self):
+        _, content_hash, mentions = self.events.popleft()
+        self.mentions -= mentions
+        count = self.content_counts[content_hash] - 1
+        if count:
+            self.content_counts[content_hash] = count
+        else:
+            del self.content_counts[content_hash]
+    
+    def record(self, now: float, content_hash, mentions: int) -> int:
+        events = self.events
+        while events and events[0][0] < now - FLOOD_WINDOW:
+            self._evict()
+        if len(events) >= FLOOD_MAX_MESSAGES:
+            self._evict()
+        events.append((now, content_hash, mentions))
+        self.mentions += mentions
+        count = self.content_counts.get(content_hash, 0) + 1
+        self.content_counts[content_hash] = count
+        return count
+
+# Mesaj seli, aynı içeriği tekrar tekrar gönderme ve toplu etiketlemeyi
+# AI'a gitmeden yakalayan yerel kontrol
+class FloodDetector:
+    def __init__(self):
+        self.trackers = OrderedDict()  # (guild_id, user_id, channel_id) -> RateTracker
+    
+    def check(self, message: discord.Message):
+        key = (message.guild.id, message.author.id, message.channel.id)
+        tracker = self.trackers.get(key)
+        if tracker is None:
+            tracker = self.trackers[key] = RateTracker()
+            if len(self.trackers) > FLOOD_TRACKER_MAX:
+                self.trackers.popitem(last=False)
+        else:
+            self.trackers.move_to_end(key)
+        
+        now = time.monotonic()
+        content = ' '.join(message.content.lower().split())
+        mentions = len(message.raw_mentions) + len(message.raw_role_mentions)
+        if message.mention_everyone:
+            mentions += FLOOD_MAX_MENTIONS
+        duplicates = tracker.record(now, hash(content) if content else None, mentions)
+        
+        if len(tracker.events) >= FLOOD_MAX_MESSAGES:
+            reason = f"Mesaj seli ({FLOOD_WINDOW} sn içinde {len(tracker.events)} mesaj)"
+        elif content and duplicates >= FLOOD_MAX_DUPLICATES:
+            reason = f"Aynı mesajı tekrarlama ({duplicates} kez)"
+        elif tracker.mentions >= FLOOD_MAX_MENTIONS:
+            reason = "Toplu etiketleme"
+        else:
+            return None
+        
+        # Bekleme süresindeki spam mesajları cezalandırılmaz ama AI'a da gönderilmez
+        punish = now >= tracker.cooldown_until
+        if punish:
+            tracker.cooldown_until = now + FLOOD_COOLDOWN
+        return {'reason': reason, 'punish': punish}
 
-async def increment_warnings(user_id: int, guild_id: int):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("""
-            UPDATE users SET warnings = warnings + 1
-            WHERE user_id = ? AND guild_id = ?
-        """, (user_id, guild_id))
-        await db.commit()
-
-async def increment_messages(user_id: int, guild_id: int):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        await db.execute("""
-            UPDATE users SET total_messages = total_messages + 1, last_active = ?
-            WHERE user_id = ? AND guild_id = ?
-        """, (datetime.now(), user_id, guild_id))
-        await db.commit()
+# ==================== GEMINI AI ====================
 
-async def get_leaderboard(guild_id: int, limit: int = 10):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("""
-            SELECT user_id, username, reputation, total_messages, warnings
-            FROM users WHERE guild_id = ?
-            ORDER BY reputation DESC LIMIT ?
-        """, (guild_id, limit))
-        return await cursor.fetchall()
-
-async def get_user_history(user_id: int, guild_id: int, limit: int = 10):
-    async with aiosqlite.connect(DATABASE_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cursor = await db.execute("""
-            SELECT change_amount, reason, created_at
-            FROM reputation_history
-            WHERE user_id = ? AND guild_id = ?
-            ORDER BY created_at DESC LIMIT ?
-        """, (user_id, guild_id, limit))
-        return await cursor.fetchall()
+# Toksisite sonuç önbelleği
+AI_CACHE_SIZE = 10_000
+AI_CACHE_TTL = 3600        # saniye
+AI_MIN_MESSAGE_LENGTH = 4  # bundan az harf/rakam içeren mesajlar AI'a gönderilmez
 
-# ==================== KÜFÜR ALGILAMA ====================
+NON_WORD_RE = re.compile(r'\W+')
 
-class ProfanityDetector:
-    def __init__(self):
-        self.profanity_list = set(word.lower() for word in TURKISH_PROFANITY)
-        self.char_replacements = {
-            '4': 'a', '@': 'a', '0': 'o', '1': 'i', '!': 'i',
-            '3': 'e', '$': 's', '5': 's', '7': 't', '+': 't',
-            '*': '', '.': '', '-': '', '_': ''
+# Normalleştirilmiş metnin özetine göre AI kararlarını saklayan TTL + LRU önbellek.
+# Aynı içerik için aynı anda gelen istekler tek bir çağrıda birleştirilir.
+class ToxicityCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()  # özet -> (son geçerlilik, karar)
+        self.inflight = {}            # özet -> asyncio.Task
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def normalize(message: str) -> str:
+        text = REPEATED_CHAR_RE.sub(r'\1\1', message.translate(NORMALIZE_TABLE))
+        return ' '.join(text.split())
+    
+    @staticmethod
+    def key(normalized: str) -> bytes:
+        return hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+    
+    def get(self, key: bytes):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def put(self, key: bytes, verdict: dict):
+        self.entries[key] = (time.monotonic() + self.ttl, verdict)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+    
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self.entries),
+            'inflight': len(self.inflight),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
         }
+
+# Kullanıcı başına Gemini sohbet oturumları. Boşta kalan oturumlar süre dolunca,
+# fazlası LRU sırasıyla atılır; her oturumun geçmişi tur ve karakter sınırıyla kırpılır.
+class ChatSessionStore:
+    def __init__(self, model, ttl: float, max_sessions: int, max_turns: int, max_chars: int):
+        self.model = model
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.max_chars = max_chars
+        self.sessions = OrderedDict()  # user_id -> [oturum, son kullanım]
+        self.expired = 0
+        self.evicted = 0
     
-    def _normalize_text(self, text: str) -> str:
-        text = text.lower()
-        for old, new in self.char_replacements.items():
-            text = text.replace(old, new)
-        text = re.sub(r'(.)\1{2,}', r'\1\1', text)
-        return text
+    def get(self, user_id: int):
+        self.prune()
+        entry = self.sessions.get(user_id)
+        if entry is None:
+            entry = [self.model.start_chat(history=[]), time.monotonic()]
+            self.sessions[user_id] = entry
+            if len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted += 1
+        else:
+            entry[1] = time.monotonic()
+            self.sessions.move_to_end(user_id)
+        return entry[0]
     
-    def check(self, message: str) -> dict:
-        normalized = self._normalize_text(message)
-        words = re.findall(r'\b\w+\b', normalized)
-        
-        matched_words = []
-        has_profanity = False
-        has_insult = False
-        severity = 'clean'
-        penalty = 0
-        
-        for word in words:
-            if word in self.profanity_list:
-                matched_words.append(word)
-                has_profanity = True
-        
-        for profanity in self.profanity_list:
-            if profanity in normalized and profanity not in matched_words:
-                matched_words.append(profanity)
-                has_profanity = True
-        
-        for pattern in INSULT_PATTERNS:
-            if pattern.lower() in normalized:
-                has_insult = True
-                if pattern not in matched_words:
-                    matched_words.append(pattern)
-        
-        if has_profanity or has_insult:
-            severe_words = ['orospu', 'piç', 'siktir', 'amk', 'aq', 'ananı', 'bacını']
-            if any(sw in normalized for sw in severe_words):
-                severity = 'severe'
-                penalty = SEVERE_PENALTY
-            elif has_insult:
-                severity = 'moderate'
-                penalty = INSULT_PENALTY
-            else:
-                severity = 'mild'
-                penalty = PROFANITY_PENALTY
-        
+    def prune(self):
+        # Sıra son kullanıma göre tutulduğu için süresi dolanlar hep baştadır
+        cutoff = time.monotonic() - self.ttl
+        while self.sessions:
+            user_id, (_, last_used) = next(iter(self.sessions.items()))
+            if last_used >= cutoff:
+                break
+            del self.sessions[user_id]
+            self.expired += 1
+    
+    @staticmethod
+    def _content_chars(content) -> int:
+        return sum(len(getattr(part, 'text', '') or '') for part in content.parts)
+    
+    def trim(self, session):
+        history = list(session.history)
+        # Kullanıcı/model sırası bozulmasın diye turlar çift çift atılır
+        excess = len(history) - self.max_turns * 2
+        if excess > 0:
+            history = history[excess + excess % 2:]
+        total = sum(self._content_chars(content) for content in history)
+        while total > self.max_chars and len(history) > 2:
+            total -= self._content_chars(history[0]) + self._content_chars(history[1])
+            history = history[2:]
+        if len(history) != len(session.history):
+            session.history = history
+    
+    def stats(self) -> dict:
+        self.prune()
+        history_bytes = sum(
+            len((getattr(part, 'text', '') or '').encode())
+            for session, _ in self.sessions.values()
+            for content in session.history
+            for part in content.parts
+        )
         return {
-            'has_profanity': has_profanity,
-            'has_insult': has_insult,
-            'severity': severity,
-            'matched_words': matched_words,
-            'penalty': penalty
+            'sessions': len(self.sessions),
+            'history_bytes': history_bytes,
+            'expired': self.expired,
+            'evicted': self.evicted
         }
 
-# ==================== GEMINI AI ====================
+AI_CLEAN_VERDICT = {'is_toxic': False, 'severity': 0, 'reason': 'Kısa mesaj', 'category': 'clean'}
+AI_ERROR_VERDICT = {'is_toxic': False, 'severity': 0, 'reason': 'Analiz hatası', 'category': 'error'}
+
+# İstekleri dakika başı sınıra göre eşit aralıklara yayan basit sınırlayıcı
+class RateLimiter:
+    def __init__(self, per_minute: int):
+        self.interval = 60 / per_minute
+        self.next_slot = 0.0
+    
+    async def acquire(self):
+        now = time.monotonic()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
 
 class GeminiAI:
     def __init__(self, api_key: str):
-        if GEMINI_AVAILABLE:
-            genai.configure(api_key=api_key)
-            self.model = genai.GenerativeModel(GEMINI_MODEL)
-            self.chat_sessions = {}
-        else:
-            self.model = None
+        self.api_key = api_key
+        self.toxicity_cache = ToxicityCache(AI_CACHE_SIZE, AI_CACHE_TTL)
+        self.rate_limiter = RateLimiter(AI_REQUESTS_PER_MINUTE)
+        self.model = None
+        self.chat_sessions = None
+        self._loading = None
+    
+    # google.generativeai açılışta değil ilk AI isteğinde içe aktarılır; ağır bir
+    # içe aktarma olduğu için event loop'u bekletmeden ayrı bir iş parçacığında yapılır
+    def _load_model(self):
+        import google.generativeai as genai
+        genai.configure(api_key=self.api_key)
+        return genai.GenerativeModel(GEMINI_MODEL)
+    
+    async def ensure_model(self) -> bool:
+        if self.model is not None:
+            return True
+        if not GEMINI_AVAILABLE:
+            return False
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(asyncio.to_thread(self._load_model))
+        try:
+            model = await asyncio.shield(self._loading)
+        except Exception as e:
+            print(f"❌ Gemini yüklenemedi: {e}")
+            self._loading = None
+            return False
+        if self.model is None:
+            self.model = model
+            self.chat_sessions = ChatSessionStore(
+                model, CHAT_SESSION_TTL, CHAT_MAX_SESSIONS, CHAT_MAX_TURNS, CHAT_MAX_HISTORY_CHARS
+            )
+        return True
     
     async def check_toxicity(self, message: str) -> dict:
-        if not self.model:
+        if not await self.ensure_model():
             return {'is_toxic': False, 'severity': 0, 'reason': 'AI devre dışı', 'category': 'unknown'}
         
+        return (await self.check_toxicity_batch([message]))[0]
+    
+    async def check_toxicity_batch(self, messages: list) -> list:
+        if not await self.ensure_model():
+            return [{'is_toxic': False, 'severity': 0, 'reason': 'AI devre dışı', 'category': 'unknown'}] * len(messages)
+        
+        cache = self.toxicity_cache
+        results = [None] * len(messages)
+        waiting = {}   # indeks -> başka bir çağrının süren isteği
+        pending = {}   # özet -> (mesaj, indeksler)
+        
+        for index, message in enumerate(messages):
+            normalized = ToxicityCache.normalize(message)
+            if len(NON_WORD_RE.sub('', normalized)) < AI_MIN_MESSAGE_LENGTH:
+                results[index] = AI_CLEAN_VERDICT
+                continue
+            key = cache.key(normalized)
+            verdict = cache.get(key)
+            if verdict is not None:
+                results[index] = verdict
+            elif key in cache.inflight:
+                waiting[index] = cache.inflight[key]
+            elif key in pending:
+                pending[key][1].append(index)
+            else:
+                pending[key] = (message, [index])
+        
+        if pending:
+            keys = list(pending)
+            loop = asyncio.get_running_loop()
+            for key in keys:
+                cache.inflight[key] = loop.create_future()
+            try:
+                verdicts = await self._request_toxicity([pending[key][0] for key in keys])
+            except BaseException:
+                verdicts = [AI_ERROR_VERDICT] * len(keys)
+                raise
+            finally:
+                for key, verdict in zip(keys, verdicts):
+                    cache.inflight.pop(key).set_result(verdict)
+                    # Hatalı analizler önbelleğe alınmaz, bir sonraki mesajda tekrar denenir
+                    if verdict.get('category') != 'error':
+                        cache.put(key, verdict)
+                    for index in pending[key][1]:
+                        results[index] = verdict
+        
+        for index, future in waiting.items():
+            results[index] = await asyncio.shield(future)
+        return results
+    
+    @staticmethod
+    def _parse_json(response_text: str):
+        response_text = response_text.strip()
+        if "```json" in response_text:
+            response_text = response_text.split("```json")[1].split("```")[0]
+        elif "```" in response_text:
+            response_text = response_text.split("```")[1].split("```")[0]
+        return json.loads(response_text.strip())
+    
+    # Model bazen eksik alanlı ya da bozuk kararlar döndürür; bunlar hata kararına
+    # çevrilir ki ceza hesaplanırken patlamasınlar ve önbelleğe de girmesinler
+    @staticmethod
+    def _checked_verdict(verdict) -> dict:
+        if isinstance(verdict, dict):
+            severity = verdict.get('severity')
+            if isinstance(severity, (int, float)) and not isinstance(severity, bool):
+                return verdict
+        metrics.inc('ai_errors')
+        return AI_ERROR_VERDICT
+    
+    async def _request_toxicity(self, messages: list) -> list:
+        await self.rate_limiter.acquire()
+        metrics.inc('ai_requests')
+        metrics.inc('ai_messages', len(messages))
         try:
-            prompt = GEMINI_SAFETY_PROMPT.format(message=message)
-            response = await self.model.generate_content_async(prompt)
-            response_text = response.text.strip()
+            if len(messages) == 1:
+                prompt = GEMINI_SAFETY_PROMPT.format(message=messages[0])
+                with metrics.timer('ai.request'):
+                    response = await self.model.generate_content_async(prompt)
+                return [self._checked_verdict(self._parse_json(response.text))]
             
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0]
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0]
-            
-            return json.loads(response_text.strip())
-        except:
-            return {'is_toxic': False, 'severity': 0, 'reason': 'Analiz hatası', 'category': 'error'}
+            numbered = "\n".join(
+                f"{i}. {json.dumps(message, ensure_ascii=False)}" for i, message in enumerate(messages, 1)
+            )
+            with metrics.timer('ai.request'):
+                response = await self.model.generate_content_async(GEMINI_BATCH_SAFETY_PROMPT.format(messages=numbered))
+            verdicts = self._parse_json(response.text)
+            if not isinstance(verdicts, list) or len(verdicts) != len(messages):
+                raise ValueError("Parti yanıtı mesaj sayısıyla uyuşmuyor")
+            return [self._checked_verdict(verdict) for verdict in verdicts]
+        except Exception:
+            metrics.inc('ai_errors')
+            return [AI_ERROR_VERDICT] * len(messages)
     
     async def chat(self, user_id: int, message: str) -> str:
-        if not self.model:
+        if not await self.ensure_model():
             return "AI şu anda kullanılamıyor."
         
         try:
-            if user_id not in self.chat_sessions:
-                self.chat_sessions[user_id] = self.model.start_chat(history=[])
-            
-            response = await self.chat_sessions[user_id].send_message_async(message)
+            session = self.chat_sessions.get(user_id)
+            response = await session.send_message_async(message)
+            self.chat_sessions.trim(session)
             return response.text
         except Exception as e:
             return f"Hata: {e}"
 
+# Yerel filtrenin temiz bulduğu mesajları arka planda AI'a soran kuyruk.
+# Mesaj işleme hiçbir zaman Gemini'yi beklemez; kararlar geldikçe cezalar uygulanır.
+class AIModerationQueue:
+    def __init__(self, bot, gemini: GeminiAI):
+        self.bot = bot
+        self.gemini = gemini
+        self.queue = asyncio.Queue(AI_QUEUE_SIZE)
+        self.workers = []
+        self.dropped = 0
+        self.skipped = 0
+    
+    def submit(self, message: discord.Message, detector) -> bool:
+        try:
+            self.queue.put_nowait((message, detector))
+            return True
+        except asyncio.QueueFull:
+            pass
+        
+        if AI_QUEUE_POLICY == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.queue.put_nowait((message, detector))
+            self.dropped += 1
+            return True
+        self.skipped += 1
+        return False
+    
+    def start(self):
+        if not self.workers:
+            self.workers = [asyncio.create_task(self._worker()) for _ in range(AI_WORKERS)]
+    
+    # Kapanışta kuyrukta kalan mesajlar da AI'a sorulur, sonra işçiler durdurulur
+    async def stop(self):
+        if self.workers:
+            try:
+                await asyncio.wait_for(self.queue.join(), AI_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"⚠️ Kapanışta {self.queue.qsize()} mesaj AI'a sorulamadı")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+    
+    async def _next_batch(self) -> list:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + AI_BATCH_WAIT
+        while len(batch) < AI_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _worker(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                verdicts = await self.gemini.check_toxicity_batch([message.content for message, _ in batch])
+                # Bir mesajdaki hata partideki diğer mesajların cezasını engellemez
+                for (message, detector), verdict in zip(batch, verdicts):
+                    try:
+                        await self.bot.apply_ai_verdict(message, detector, verdict)
+                    except Exception as e:
+                        print(f"❌ AI kararı uygulanamadı: {e}")
+            except Exception as e:
+                print(f"❌ AI moderasyon hatası: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+    
+    def stats(self) -> dict:
+        return {
+            'queued': self.queue.qsize(),
+            'dropped': self.dropped,
+            'skipped': self.skipped
+        }
+
+# ==================== MODERASYON İŞLEMLERİ ====================
+
+WARNING_SUMMARY_LINES = 15     # toplu uyarı mesajında gösterilen en fazla satır
+WARNING_COOLDOWN = 10          # saniye; bir kullanıcıya bu süre içinde en fazla bir uyarı gider
+WARNING_DELETE_AFTER = 30      # uyarı mesajlarının ömrü (saniye)
+ACTION_MAX_ATTEMPTS = 4        # ilk deneme dahil
+ACTION_RETRY_BASE = 1.0        # saniye; her tekrar denemede ikiye katlanır
+ACTION_MEMORY_SIZE = 10_000    # hatırlanan en fazla ban / susturma
+ACTION_DRAIN_TIMEOUT = 10      # saniye; kapanışta sıradaki işlemler için beklenen süre
+
+SEVERITY_ORDER = {'mild': 0, 'moderate': 1, 'severe': 2}
+
+def severity_emoji(severity: str) -> str:
+    return "🚨" if severity == 'severe' else "⚠️" if severity == 'moderate' else "💡"
+
+# Bir kullanıcının bir kanalda henüz gönderilmemiş uyarıları; yeni uyarılar bunun üzerine eklenir
+class PendingWarning:
+    __slots__ = ('message', 'severity', 'penalty', 'reasons', 'new_rep', 'count')
+    
+    def __init__(self, message: discord.Message, severity: str, penalty: int, reason: str, new_rep: int):
+        self.message = message
+        self.severity = severity
+        self.penalty = penalty
+        self.reasons = [reason]
+        self.new_rep = new_rep
+        self.count = 1
+    
+    def merge(self, message: discord.Message, severity: str, penalty: int, reason: str, new_rep: int):
+        self.message = message
+        if SEVERITY_ORDER[severity] > SEVERITY_ORDER[self.severity]:
+            self.severity = severity
+        self.penalty += penalty
+        if reason not in self.reasons:
+            self.reasons.append(reason)
+        self.new_rep = new_rep
+        self.count += 1
+
+# Uyarı mesajları, susturma ve banlar mesaj işlemeyi beklemeden burada yürütülür.
+# Her Discord rotası (kanal mesajları, sunucu üye işlemleri) kendi sırasında çalışır;
+# böylece rate limit'e takılan bir kanal diğerlerini bekletmez. Kullanıcı başına
+# tekilleştirme yapılır: bekleyen bir ban susturmayı geçersiz kılar, süren bir
+# susturma tekrarlanmaz ve uyarılar kullanıcı başına tek satırda birleştirilir.
+class ModerationActionExecutor:
+    def __init__(self):
+        self.lanes = {}          # rota -> bekleyen işlemler (deque)
+        self.tasks = set()
+        self.warnings = {}       # channel_id -> {user_id: PendingWarning}
+        self.last_warned = {}    # (channel_id, user_id) -> son uyarı zamanı
+        self.punishments = {}    # (guild_id, user_id) -> ('ban' | 'timeout', member)
+        self.banned = OrderedDict()
+        self.muted_until = OrderedDict()
+    
+    def _enqueue(self, route: tuple, action: tuple):
+        lane = self.lanes.get(route)
+        if lane is None:
+            lane = self.lanes[route] = deque()
+            task = asyncio.create_task(self._drain(route, lane))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        lane.append(action)
+    
+    async def _drain(self, route: tuple, lane: deque):
+        try:
+            while lane:
+                action = lane.popleft()
+                try:
+                    if action[0] == 'warn':
+                        await self._send_warnings(action[1])
+                    else:
+                        await self._punish(action[1])
+                except Exception as e:
+                    print(f"❌ Moderasyon işlemi hatası ({action[0]}): {e}")
+        finally:
+            self.lanes.pop(route, None)
+    
+    # Kapanışta sıradaki uyarı ve cezalar gönderilir; bekleme süresine (cooldown)
+    # takılıp ertelenmiş uyarılar ve süre aşımında kalanlar iptal edilir
+    async def stop(self):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ACTION_DRAIN_TIMEOUT
+        while self.tasks and loop.time() < deadline:
+            await asyncio.wait(set(self.tasks), timeout=deadline - loop.time())
+        if self.tasks:
+            print(f"⚠️ Kapanışta {self.pending()} moderasyon işlemi gönderilemedi")
+        for task in list(self.tasks):
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.lanes.clear()
+        self.warnings.clear()
+        self.punishments.clear()
+    
+    def pending(self) -> int:
+        return sum(len(lane) for lane in self.lanes.values())
+    
+    # ---------- uyarılar ----------
+    
+    def warn(self, message: discord.Message, severity: str, penalty: int, reason: str, new_rep: int):
+        channel_id = message.channel.id
+        batch = self.warnings.get(channel_id)
+        if batch is None:
+            batch = self.warnings[channel_id] = {}
+            self._enqueue(('channel', channel_id), ('warn', channel_id))
+        entry = batch.get(message.author.id)
+        if entry is None:
+            batch[message.author.id] = PendingWarning(message, severity, penalty, reason, new_rep)
+        else:
+            entry.merge(message, severity, penalty, reason, new_rep)
+    
+    async def _send_warnings(self, channel_id: int):
+        # Sıra beklerken gelen uyarılar da bu gönderime dahildir
+        batch = self.warnings.pop(channel_id, None)
+        if not batch:
+            return
+        
+        now = time.monotonic()
+        ready, deferred = [], {}
+        for user_id, entry in batch.items():
+            last = self.last_warned.get((channel_id, user_id))
+            if last is not None and now - last < WARNING_COOLDOWN:
+                deferred[user_id] = entry
+            else:
+                ready.append(entry)
+        
+        if deferred:
+            # Bekleme süresi dolunca kalanlar (ve o arada gelenler) tek mesajda gider
+            wait = min(WARNING_COOLDOWN - (now - self.last_warned[(channel_id, user_id)]) for user_id in deferred)
+            self.warnings[channel_id] = deferred
+            asyncio.get_running_loop().call_later(
+                wait, self._enqueue, ('channel', channel_id), ('warn', channel_id)
+            )
+        if not ready:
+            return
+        
+        for entry in ready:
+            self.last_warned[(channel_id, entry.message.author.id)] = now
+        if len(self.last_warned) > ACTION_MEMORY_SIZE:
+            for key in [key for key, sent in self.last_warned.items() if now - sent >= WARNING_COOLDOWN]:
+                del self.last_warned[key]
+        
+        if len(ready) == 1 and ready[0].count == 1:
+            entry = ready[0]
+            embed = discord.Embed(
+                description=f"{severity_emoji(entry.severity)} **Uyarı!** {entry.reasons[0]}",
+                color=discord.Color.red() if entry.severity == 'severe' else discord.Color.orange()
+            )
+            embed.set_footer(text=f"📉 -{entry.penalty} rep | Kalan: {entry.new_rep}")
+            await self._attempt('warn', channel_id, lambda: entry.message.reply(embed=embed, delete_after=WARNING_DELETE_AFTER))
+            return
+        
+        lines = []
+        for entry in ready[:WARNING_SUMMARY_LINES]:
+            reasons = ", ".join(entry.reasons[:3])
+            repeat = f" ×{entry.count}" if entry.count > 1 else ""
+            lines.append(
+                f"{severity_emoji(entry.severity)} {entry.message.author.mention}{repeat} {reasons[:80]} "
+                f"(📉 -{entry.penalty} | Kalan: {entry.new_rep})"
+            )
+        if len(ready) > WARNING_SUMMARY_LINES:
+            lines.append(f"... ve {len(ready) - WARNING_SUMMARY_LINES} kullanıcı daha")
+        total = sum(entry.count for entry in ready)
+        embed = discord.Embed(
+            title=f"⚠️ {total} Uyarı",
+            description="\n".join(lines),
+            color=discord.Color.red() if any(entry.severity == 'severe' for entry in ready) else discord.Color.orange()
+        )
+        channel = ready[-1].message.channel
+        await self._attempt('warn', channel_id, lambda: channel.send(embed=embed, delete_after=WARNING_DELETE_AFTER))
+    
+    # ---------- susturma / ban ----------
+    
+    def ban(self, member: discord.Member):
+        key = (member.guild.id, member.id)
+        if key in self.banned:
+            return
+        current = self.punishments.get(key)
+        self.punishments[key] = ('ban', member)
+        if current is None:
+            self._enqueue(('guild', member.guild.id), ('punish', key))
+    
+    # Banı kaldırılıp sunucuya geri dönen üye tekrar banlanabilsin
+    def forget_ban(self, guild_id: int, user_id: int):
+        self.banned.pop((guild_id, user_id), None)
+    
+    def timeout(self, member: discord.Member):
+        key = (member.guild.id, member.id)
+        if key in self.banned or key in self.punishments:
+            return
+        if self.muted_until.get(key, 0) > time.monotonic():
+            return
+        self.punishments[key] = ('timeout', member)
+        self._enqueue(('guild', member.guild.id), ('punish', key))
+    
+    async def _punish(self, key: tuple):
+        # Sırada beklerken susturma bana dönüşmüş olabilir; en son karar uygulanır
+        kind, member = self.punishments.pop(key)
+        if kind == 'ban':
+            with metrics.timer('discord.ban'):
+                done = await self._attempt('ban', member.id, lambda: member.ban(reason="Reputation 0"))
+            if done:
+                metrics.inc('bans')
+                self._remember(self.banned, key, True)
+        else:
+            with metrics.timer('discord.timeout'):
+                done = await self._attempt('timeout', member.id, lambda: member.timeout(
+                    timedelta(minutes=MUTE_DURATION), reason="Düşük reputation"
+                ))
+            if done:
+                metrics.inc('timeouts')
+                self._remember(self.muted_until, key, time.monotonic() + MUTE_DURATION * 60)
+    
+    def _remember(self, store: OrderedDict, key: tuple, value):
+        store[key] = value
+        store.move_to_end(key)
+        if len(store) > ACTION_MEMORY_SIZE:
+            store.popitem(last=False)
+    
+    # ---------- tekrar deneme ----------
+    
+    async def _attempt(self, kind: str, target: int, call) -> bool:
+        for attempt in range(ACTION_MAX_ATTEMPTS):
+            try:
+                await call()
+                return True
+            except (discord.Forbidden, discord.NotFound) as e:
+                # Yetki yok ya da hedef artık yok; tekrar denemek anlamsız
+                metrics.inc('moderation_failures')
+                print(f"❌ Moderasyon işlemi yapılamadı ({kind} {target}): {e}")
+                return False
+            except discord.RateLimited as e:
+                delay = e.retry_after
+            except discord.HTTPException as e:
+                if e.status != 429 and e.status < 500:
+                    metrics.inc('moderation_failures')
+                    print(f"❌ Moderasyon işlemi reddedildi ({kind} {target}): {e}")
+                    return False
+                delay = ACTION_RETRY_BASE * 2 ** attempt
+            except (OSError, asyncio.TimeoutError):
+                delay = ACTION_RETRY_BASE * 2 ** attempt
+            
+            if attempt + 1 < ACTION_MAX_ATTEMPTS:
+                metrics.inc('moderation_retries')
+                await asyncio.sleep(delay + random.uniform(0, ACTION_RETRY_BASE))
+        
+        metrics.inc('moderation_failures')
+        print(f"❌ Moderasyon işlemi {ACTION_MAX_ATTEMPTS} denemede başarısız ({kind} {target})")
+        return False
+
+# ==================== MESAJ HATTI ====================
+
+PIPELINE_WINDOW = 0.005        # saniye; bir grubun ilk mesajından sonra beklenen en uzun süre
+PIPELINE_MAX_BATCH = 200       # grup başına en fazla mesaj
+PIPELINE_QUEUE_SIZE = 10000    # işlenmeyi bekleyen en fazla mesaj
+PIPELINE_QUEUE_POLICY = "drop_oldest"   # kuyruk doluysa: drop_oldest (en eskiyi at) / skip (yeni mesajı atla)
+PIPELINE_DRAIN_TIMEOUT = 10    # saniye; kapanışta kuyruktaki mesajların işlenmesi için beklenen süre
+
+# Gelen mesajları birkaç milisaniyelik pencerelerde toplayıp GuardianBot.process_batch'e
+# veren hat. Tek işçi grupları sırayla işler ve grup içinde mesajlar geliş sırasını korur;
+# böylece bir kullanıcının mesajları her zaman gönderildiği sırayla cezalandırılır.
+class MessagePipeline:
+    def __init__(self, bot, window: float, max_batch: int):
+        self.bot = bot
+        self.window = window
+        self.max_batch = max_batch
+        self.queue = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        self._task = None
+    
+    # Kuyruk dolarsa (veritabanı işlemlere yetişemiyorsa) bellek sınırsız büyümez;
+    # politikaya göre en eski ya da yeni mesaj kontrol edilmeden atılır
+    def submit(self, message: discord.Message) -> bool:
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+        
+        metrics.inc('pipeline_dropped')
+        if PIPELINE_QUEUE_POLICY == "drop_oldest":
+            self.queue.get_nowait()
+            self.queue.task_done()
+            self.queue.put_nowait(message)
+            return True
+        return False
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    # Kapanışta kuyrukta kalan mesajlar da işlenir, sonra işçi durdurulur
+    async def stop(self):
+        if self._task is not None:
+            try:
+                await asyncio.wait_for(self.queue.join(), PIPELINE_DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"⚠️ Kapanışta {self.queue.qsize()} mesaj işlenemedi")
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _next_batch(self) -> list:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self.bot.process_batch(batch)
+            except Exception as e:
+                print(f"❌ Mesaj grubu işlenemedi: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+# ==================== ÜYE EŞİTLEME ====================
+
+MEMBER_SYNC_CHUNK = 1000       # transaction başına yazılan en fazla üye
+MEMBER_SYNC_PAUSE = 0.1        # parçalar arası bekleme (saniye)
+MEMBER_SYNC_BUSY_PAUSE = 1.0   # event loop gecikirken parçalar arası bekleme
+
+# Bot kapalıyken olan değişiklikleri users tablosuna yansıtır: yeni üyeler eklenir,
+# değişen adlar güncellenir, ayrılanlar işaretlenip sıralamadan çıkarılır. Sunucular
+# tek bir arka plan görevinde sırayla, parça parça işlenir; her parçadan sonra
+# canlı mesaj işlemeye sıra verilir.
+class MemberReconciler:
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.queued = set()
+        self._task = None
+    
+    def submit(self, guild: discord.Guild):
+        if guild.id not in self.queued:
+            self.queued.add(guild.id)
+            self.queue.put_nowait(guild)
+    
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def _pause(self):
+        await asyncio.sleep(MEMBER_SYNC_BUSY_PAUSE if metrics.loop_lag > DETECTION_BUSY_LAG else MEMBER_SYNC_PAUSE)
+    
+    async def _run(self):
+        while True:
+            guild = await self.queue.get()
+            self.queued.discard(guild.id)
+            try:
+                updated, departed = await self.reconcile(guild)
+                if updated or departed:
+                    print(f"👥 {guild.name}: {updated} üye güncellendi, {departed} ayrılan işaretlendi")
+            except Exception as e:
+                print(f"❌ Üye eşitlemesi başarısız ({guild.name}): {e}")
+    
+    @timed('reconcile_guild')
+    async def reconcile(self, guild: discord.Guild) -> tuple:
+        if not guild.chunked:
+            await guild.chunk()
+        
+        known = {row['user_id']: row for row in await get_guild_members(guild.id)}
+        members = [member for member in guild.members if not member.bot]
+        updated = 0
+        for start in range(0, len(members), MEMBER_SYNC_CHUNK):
+            # Yalnızca yeni, geri dönen ya da adı değişen üyeler yazılır
+            rows = []
+            for member in members[start:start + MEMBER_SYNC_CHUNK]:
+                row = known.get(member.id)
+                if row is None or row['departed'] or row['username'] != member.display_name:
+                    rows.append((member.id, member.display_name))
+            if rows:
+                await upsert_members(guild.id, rows)
+                for user_id, _ in rows:
+                    row = known.get(user_id)
+                    if row is None:
+                        leaderboards.add_if_missing(guild.id, user_id, STARTING_REPUTATION)
+                    elif row['departed']:
+                        leaderboards.update(guild.id, user_id, row['reputation'])
+                updated += len(rows)
+            await self._pause()
+        
+        # Ayrılma, tarama bittiği anki üye listesine göre belirlenir; bu sırada
+        # katılanlar yanlışlıkla işaretlenmez
+        departed = [
+            user_id for user_id, row in known.items()
+            if not row['departed'] and guild.get_member(user_id) is None
+        ]
+        for start in range(0, len(departed), MEMBER_SYNC_CHUNK):
+            await mark_departed(guild.id, departed[start:start + MEMBER_SYNC_CHUNK])
+            await self._pause()
+        return updated, len(departed)
+
 # ==================== BOT ====================
 
 intents = discord.Intents.default()
@@ -304,110 +2708,305 @@ intents.message_content = True
 intents.members = True
 intents.guilds = True
 
-class GuardianBot(commands.Bot):
+# Shard ayarları: SHARD_COUNT boşsa Discord'un önerdiği sayı kullanılır.
+# SHARD_IDS bu sürecin çalıştıracağı shard'ları seçer (ör. "0,2"); SHARD_WORKERS > 1
+# ise main() shard'ları bu kadar alt sürece paylaştırır.
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0')) or None
+SHARD_IDS = [int(i) for i in os.getenv('SHARD_IDS', '').split(',') if i.strip()] or None
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', '1'))
+
+# Slash komutları yalnızca bu dosyadaki özet değişince Discord'a gönderilir
+COMMAND_HASH_PATH = os.getenv('COMMAND_HASH_PATH', '.command_hash')
+FORCE_COMMAND_SYNC = os.getenv('FORCE_COMMAND_SYNC', '0') == '1'
+
+class GuardianBot(commands.AutoShardedBot):
     def __init__(self):
         super().__init__(
             command_prefix=os.getenv('BOT_PREFIX', '!'),
             intents=intents,
-            help_command=None
+            help_command=None,
+            shard_count=SHARD_COUNT,
+            # SHARD_COUNT'suz SHARD_IDS discord.py'de hata verir; bot modül yüklenirken
+            # oluşturulduğundan yok sayılır, main() kullanıcıyı uyarır
+            shard_ids=SHARD_IDS if SHARD_COUNT else None
         )
         
-        self.profanity_detector = ProfanityDetector()
+        self.filters = GuildFilters()
+        self.flood_detector = FloodDetector()
+        self.detection_pool = DetectionPool(DETECTION_OFFLOAD, DETECTION_WORKERS)
+        self.pipeline = MessagePipeline(self, PIPELINE_WINDOW, PIPELINE_MAX_BATCH)
+        self.reconciler = MemberReconciler()
+        self.actions = ModerationActionExecutor()
         
         gemini_key = os.getenv('GEMINI_API_KEY')
         if gemini_key and GEMINI_AVAILABLE:
             self.gemini = GeminiAI(gemini_key)
+            self.ai_queue = AIModerationQueue(self, self.gemini)
             print("✅ Gemini AI başlatıldı")
         else:
             self.gemini = None
+            self.ai_queue = None
+        
+        self.history_task = None
+        self.lag_task = None
+        self.metrics_server = None
+        self.startup_times = {'modüller': time.perf_counter() - STARTUP_STARTED}
+        self.startup_reported = False
     
     async def setup_hook(self):
-        await init_database()
+        with self.startup_phase('veritabanı'):
+            await init_database()
+        with self.startup_phase('filtreler'):
+            await self.filters.load_all()
+        self.detection_pool.start(self.filters.default)
+        self.pipeline.start()
+        self.reconciler.start()
+        message_counters.start()
+        if self.ai_queue:
+            self.ai_queue.start()
+        if self.is_primary:
+            self.history_task = asyncio.create_task(self.history_maintenance())
+        self.lag_task = asyncio.create_task(metrics.monitor_loop_lag())
+        self.register_gauges()
+        if METRICS_PORT:
+            self.metrics_server = await metrics.start_server(METRICS_HOST, METRICS_PORT)
+            print(f"📈 Metrikler: http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+        if self.is_primary:
+            with self.startup_phase('komut senkronu'):
+                if await self.sync_commands():
+                    print("✅ Komutlar senkronize edildi")
+                else:
+                    print("✅ Komutlar güncel, senkron atlandı")
+    
+    @contextmanager
+    def startup_phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_times[name] = time.perf_counter() - start
+    
+    # Kayıtlı komutların (ve uygulama kimliğinin) özeti; değişmediyse sync atlanır
+    def command_hash(self) -> str:
+        commands_data = sorted(
+            (command.to_dict(self.tree) for command in self.tree.get_commands()),
+            key=lambda data: (data.get('type', 1), data['name'])
+        )
+        payload = json.dumps(
+            {'application_id': self.application_id, 'commands': commands_data},
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+    
+    async def sync_commands(self) -> bool:
+        digest = self.command_hash()
+        if not FORCE_COMMAND_SYNC:
+            try:
+                with open(COMMAND_HASH_PATH, encoding='utf-8') as f:
+                    if f.read().strip() == digest:
+                        return False
+            except OSError:
+                pass
+        
         await self.tree.sync()
-        print("✅ Komutlar senkronize edildi")
+        try:
+            with open(COMMAND_HASH_PATH, 'w', encoding='utf-8') as f:
+                f.write(digest)
+        except OSError as e:
+            print(f"⚠️ Komut özeti kaydedilemedi: {e}")
+        return True
+    
+    # Komut senkronu ve geçmiş bakımı gibi tüm bota ait işler yalnızca
+    # shard 0'ı çalıştıran süreçte yapılır
+    @property
+    def is_primary(self) -> bool:
+        return self.shard_ids is None or 0 in self.shard_ids
+    
+    async def close(self):
+        if self.history_task:
+            self.history_task.cancel()
+        if self.lag_task:
+            self.lag_task.cancel()
+        await self.reconciler.stop()
+        # Kuyruktaki mesajlar, AI kararları ve bunlardan doğan uyarı/ban işlemleri
+        # Discord bağlantısı kapanmadan bitirilir; HTTP oturumu kapandıktan sonra gönderilemezler
+        await self.pipeline.stop()
+        if self.ai_queue:
+            await self.ai_queue.stop()
+        await self.actions.stop()
+        await super().close()
+        if self.metrics_server:
+            self.metrics_server.close()
+        self.detection_pool.stop()
+        await message_counters.stop()
+        await database.close()
+    
+    def register_gauges(self):
+        metrics.gauge('event_loop_lag_seconds', lambda: metrics.loop_lag)
+        metrics.gauge('user_cache_size', lambda: len(user_cache.entries))
+        metrics.gauge('user_cache_hits', lambda: user_cache.hits)
+        metrics.gauge('user_cache_misses', lambda: user_cache.misses)
+        metrics.gauge('pending_message_counters', lambda: len(message_counters.pending))
+        metrics.gauge('pipeline_queue_size', lambda: self.pipeline.queue.qsize())
+        metrics.gauge('moderation_actions_pending', lambda: self.actions.pending())
+        metrics.gauge('flood_trackers', lambda: len(self.flood_detector.trackers))
+        metrics.gauge('guilds', lambda: len(self.guilds))
+        if self.gemini:
+            cache = self.gemini.toxicity_cache
+            metrics.gauge('ai_cache_size', lambda: len(cache.entries))
+            metrics.gauge('ai_cache_hits', lambda: cache.hits)
+            metrics.gauge('ai_cache_misses', lambda: cache.misses)
+            metrics.gauge('ai_queue_size', lambda: self.ai_queue.queue.qsize())
+            metrics.gauge('ai_queue_dropped', lambda: self.ai_queue.dropped)
+            # Sohbet deposu model ilk AI çağrısında yüklenince oluşur; o zamana kadar 0
+            gemini = self.gemini
+            metrics.gauge('chat_sessions', lambda: (
+                len(gemini.chat_sessions.sessions) if gemini.chat_sessions is not None else 0
+            ))
+            metrics.gauge('chat_history_bytes', lambda: (
+                gemini.chat_sessions.stats()['history_bytes'] if gemini.chat_sessions is not None else 0
+            ))
+    
+    async def history_maintenance(self):
+        while True:
+            try:
+                moved = await compact_reputation_history()
+                if moved:
+                    print(f"🧹 {moved} eski geçmiş kaydı günlük özete taşındı")
+            except Exception as e:
+                print(f"❌ Geçmiş bakımı başarısız: {e}")
+            await asyncio.sleep(HISTORY_COMPACT_INTERVAL)
     
     async def on_ready(self):
-        print(f"✅ {self.user.name} aktif! ({len(self.guilds)} sunucu)")
+        shards = self.shard_ids or range(self.shard_count or 1)
+        print(f"✅ {self.user.name} aktif! ({len(self.guilds)} sunucu, shard {list(shards)})")
+        if not self.startup_reported:
+            self.startup_reported = True
+            self.report_startup()
+        for guild in self.guilds:
+            self.reconciler.submit(guild)
         await self.change_presence(activity=discord.Activity(
             type=discord.ActivityType.watching, name="sunucuyu koruyorum 🛡️"
         ))
     
+    def report_startup(self):
+        total = time.perf_counter() - STARTUP_STARTED
+        phases = " | ".join(f"{name} {seconds:.2f} sn" for name, seconds in self.startup_times.items())
+        print(f"⏱️ Açılış {total:.2f} sn ({phases})")
+        metrics.gauge('startup_seconds', lambda: total)
+    
+    async def on_guild_join(self, guild: discord.Guild):
+        self.reconciler.submit(guild)
+    
     async def on_member_join(self, member: discord.Member):
+        self.actions.forget_ban(member.guild.id, member.id)
+        if not member.bot:
+            await add_member(member.id, member.guild.id, member.display_name)
+    
+    async def on_member_remove(self, member: discord.Member):
         if not member.bot:
-            await create_user(member.id, member.guild.id, member.display_name)
+            await mark_departed(member.guild.id, [member.id])
     
     async def on_message(self, message: discord.Message):
         if message.author.bot or not message.guild:
             return
         
-        user_data = await get_user(message.author.id, message.guild.id)
-        if not user_data:
-            await create_user(message.author.id, message.guild.id, message.author.display_name)
+        with metrics.timer('on_message'):
+            self.pipeline.submit(message)
+            with metrics.timer('process_commands'):
+                await self.process_commands(message)
+    
+    # Tek mesajı beklemeden işler (pipeline dışı çağrılar ve benchmark için)
+    async def handle_message(self, message: discord.Message):
+        await self.process_batch([message])
+    
+    @timed('process_batch')
+    async def process_batch(self, messages: list):
+        metrics.inc('messages', len(messages))
+        metrics.inc('batches')
+        # Her mesajın cezaları kendi sırasına yazılır; böylece flood ve küfür cezaları
+        # aynı kullanıcı için geliş sırasıyla uygulanır
+        penalties = [[] for _ in messages]
+        pending = []
+        
+        for index, message in enumerate(messages):
+            increment_messages(message.author.id, message.guild.id, message.author.display_name)
+            detector = self.filters.get(message.guild.id)
+            
+            # Spam ayrıca cezalandırılır ve AI'a gönderilmez ama küfür kontrolü yine yapılır;
+            # izleyici durumlu olduğu için mesajlar geliş sırasıyla değerlendirilir
+            with metrics.timer('detect.flood'):
+                flood = self.flood_detector.check(message)
+            if flood:
+                metrics.inc('spam_detected')
+                if flood['punish']:
+                    penalties[index].append(
+                        (message, detector, 'moderate', detector.settings['spam_penalty'], flood['reason'])
+                    )
+            pending.append((index, message, detector, flood is not None))
+        
+        # Herkesi kontrol et (moderatörler dahil); uzun mesajlar havuzda paralel çalışır
+        with metrics.timer('detect.profanity'):
+            checks = await asyncio.gather(*(
+                self.detection_pool.check(detector, message.content) for _, message, detector, _ in pending
+            ))
         
-        await increment_messages(message.author.id, message.guild.id)
+        for (index, message, detector, flooded), local_check in zip(pending, checks):
+            if local_check['has_profanity'] or local_check['has_insult']:
+                reason = f"Yasaklı kelimeler: {', '.join(local_check['matched_words'][:3])}"
+                penalties[index].append((message, detector, local_check['severity'], local_check['penalty'], reason))
+            elif self.ai_queue and not flooded:
+                # AI kontrolü (opsiyonel) arka planda yapılır
+                if not self.ai_queue.submit(message, detector):
+                    metrics.inc('ai_skipped')
+        
+        await self.apply_penalties([penalty for entries in penalties for penalty in entries])
+    
+    async def apply_ai_verdict(self, message: discord.Message, detector, ai_result: dict):
+        if not ai_result.get('is_toxic'):
+            return
         
-        # Herkesi kontrol et (moderatörler dahil)
-        await self.moderate_message(message)
+        if ai_result['severity'] >= 7:
+            severity = 'severe'
+            penalty = detector.settings['severe_penalty']
+        elif ai_result['severity'] >= 4:
+            severity = 'moderate'
+            penalty = detector.settings['insult_penalty']
+        else:
+            severity = 'mild'
+            penalty = detector.settings['profanity_penalty']
+        reason = ai_result.get('reason', 'AI tespit')
         
-        await self.process_commands(message)
+        await self.apply_penalty(message, detector, severity, penalty, reason)
     
-    async def moderate_message(self, message: discord.Message):
-        local_check = self.profanity_detector.check(message.content)
+    async def apply_penalty(self, message: discord.Message, detector, severity: str, penalty: int, reason: str):
+        await self.apply_penalties([(message, detector, severity, penalty, reason)])
+    
+    # penalties: (message, detector, severity, penalty, reason), geliş sırasıyla
+    async def apply_penalties(self, penalties: list):
+        penalties = [entry for entry in penalties if entry[3] > 0]
+        if not penalties:
+            return
         
-        is_toxic = local_check['has_profanity'] or local_check['has_insult']
-        penalty = local_check['penalty']
-        severity = local_check['severity']
-        reason = f"Yasaklı kelimeler: {', '.join(local_check['matched_words'][:3])}" if local_check['matched_words'] else ""
+        metrics.inc('penalties', len(penalties))
+        new_reps = await update_reputations([
+            (message.author.id, message.guild.id, -penalty, reason, message.content,
+             message.author.display_name, True)
+            for message, _, _, penalty, reason in penalties
+        ])
         
-        # AI kontrolü (opsiyonel)
-        if self.gemini and not is_toxic:
-            ai_result = await self.gemini.check_toxicity(message.content)
-            if ai_result.get('is_toxic'):
-                is_toxic = True
-                if ai_result['severity'] >= 7:
-                    severity = 'severe'
-                    penalty = SEVERE_PENALTY
-                elif ai_result['severity'] >= 4:
-                    severity = 'moderate'
-                    penalty = INSULT_PENALTY
-                else:
-                    severity = 'mild'
-                    penalty = PROFANITY_PENALTY
-                reason = ai_result.get('reason', 'AI tespit')
+        # Discord çağrıları beklenmez; yürütücü kullanıcı başına birleştirip sırayla gönderir
+        latest = {}
+        for (message, detector, severity, penalty, reason), new_rep in zip(penalties, new_reps):
+            self.actions.warn(message, severity, penalty, reason, new_rep)
+            latest[(message.author.id, message.guild.id)] = (message, detector, new_rep)
         
-        if is_toxic and penalty > 0:
-            new_rep = await update_reputation(
-                message.author.id, message.guild.id, -penalty, reason, message.content
-            )
-            await increment_warnings(message.author.id, message.guild.id)
-            
-            # Uyarı gönder
-            emoji = "🚨" if severity == 'severe' else "⚠️" if severity == 'moderate' else "💡"
-            embed = discord.Embed(
-                description=f"{emoji} **Uyarı!** {reason}",
-                color=discord.Color.red() if severity == 'severe' else discord.Color.orange()
-            )
-            embed.set_footer(text=f"📉 -{penalty} rep | Kalan: {new_rep}")
-            
-            try:
-                await message.reply(embed=embed, delete_after=30)
-            except:
-                pass
-            
-            # Ceza kontrolü
-            if new_rep <= BAN_THRESHOLD:
-                try:
-                    await message.author.ban(reason="Reputation 0")
-                except:
-                    pass
-            elif new_rep <= MUTE_THRESHOLD:
-                try:
-                    await message.author.timeout(
-                        discord.utils.utcnow() + discord.timedelta(minutes=10),
-                        reason="Düşük reputation"
-                    )
-                except:
-                    pass
+        # Ceza kontrolü: kullanıcı başına, grubun sonundaki puanla bir kez
+        for message, detector, new_rep in latest.values():
+            if new_rep <= detector.settings['ban_threshold']:
+                self.actions.ban(message.author)
+            elif new_rep <= detector.settings['mute_threshold']:
+                self.actions.timeout(message.author)
 
 bot = GuardianBot()
 
@@ -419,8 +3018,7 @@ async def reputation(interaction: discord.Interaction, member: discord.Member =
     user_data = await get_user(target.id, interaction.guild_id)
     
     if not user_data:
-        await create_user(target.id, interaction.guild_id, target.display_name)
-        user_data = await get_user(target.id, interaction.guild_id)
+        user_data = await create_user(target.id, interaction.guild_id, target.display_name)
     
     rep = user_data['reputation']
     
@@ -438,6 +3036,10 @@ async def reputation(interaction: discord.Interaction, member: discord.Member =
     embed.add_field(name="Mesaj", value=user_data['total_messages'], inline=True)
     embed.add_field(name="Uyarı", value=f"⚠️ {user_data['warnings']}", inline=True)
     
+    rank, total = await get_rank(target.id, interaction.guild_id)
+    if rank:
+        embed.add_field(name="Sıra", value=f"#{rank} / {total}", inline=True)
+    
     await interaction.response.send_message(embed=embed)
 
 @bot.tree.command(name="siralama", description="Reputation sıralaması")
@@ -465,12 +3067,10 @@ async def warn(interaction: discord.Interaction, member: discord.Member, sebep:
         await interaction.response.send_message("Botları uyaramazsın!", ephemeral=True)
         return
     
-    user_data = await get_user(member.id, interaction.guild_id)
-    if not user_data:
-        await create_user(member.id, interaction.guild_id, member.display_name)
-    
-    new_rep = await update_reputation(member.id, interaction.guild_id, -abs(puan), f"Mod: {sebep}")
-    await increment_warnings(member.id, interaction.guild_id)
+    new_rep = await update_reputation(
+        member.id, interaction.guild_id, -abs(puan), f"Mod: {sebep}",
+        username=member.display_name, warning=True
+    )
     
     embed = discord.Embed(title="⚠️ Uyarı", color=discord.Color.orange())
     embed.add_field(name="Üye", value=member.mention, inline=True)
@@ -486,11 +3086,9 @@ async def reward(interaction: discord.Interaction, member: discord.Member, sebep
         await interaction.response.send_message("Botlara ödül veremezsin!", ephemeral=True)
         return
     
-    user_data = await get_user(member.id, interaction.guild_id)
-    if not user_data:
-        await create_user(member.id, interaction.guild_id, member.display_name)
-    
-    new_rep = await update_reputation(member.id, interaction.guild_id, abs(puan), f"Ödül: {sebep}")
+    new_rep = await update_reputation(
+        member.id, interaction.guild_id, abs(puan), f"Ödül: {sebep}", username=member.display_name
+    )
     
     embed = discord.Embed(title="🎉 Ödül!", color=discord.Color.green())
     embed.add_field(name="Üye", value=member.mention, inline=True)
@@ -516,11 +3114,164 @@ async def ask(interaction: discord.Interaction, soru: str):
     
     await interaction.followup.send(embed=embed)
 
+HISTORY_PAGE_SIZE = 10
+
+def build_history_embed(target: discord.Member, rows) -> discord.Embed:
+    embed = discord.Embed(title=f"📜 {target.display_name} - Geçmiş", color=discord.Color.blurple())
+    lines = []
+    for row in rows:
+        sign = "+" if row['change_amount'] > 0 else ""
+        lines.append(f"`{row['created_at'][:16]}` **{sign}{row['change_amount']}** - {row['reason']}")
+    embed.description = "\n".join(lines) or "Kayıt yok."
+    embed.set_footer(text=f"{HISTORY_RETENTION_DAYS} günden eski kayıtlar günlük özet olarak saklanır")
+    return embed
+
+class HistoryView(discord.ui.View):
+    def __init__(self, owner_id: int, target: discord.Member, guild_id: int, before_id: int):
+        super().__init__(timeout=120)
+        self.owner_id = owner_id
+        self.target = target
+        self.guild_id = guild_id
+        self.before_id = before_id
+    
+    @discord.ui.button(label="Daha eski", emoji="⏭️", style=discord.ButtonStyle.secondary)
+    async def older(self, interaction: discord.Interaction, button: discord.ui.Button):
+        if interaction.user.id != self.owner_id:
+            await interaction.response.send_message("Bu menü sana ait değil!", ephemeral=True)
+            return
+        
+        rows = await get_user_history(self.target.id, self.guild_id, HISTORY_PAGE_SIZE + 1, self.before_id)
+        has_more = len(rows) > HISTORY_PAGE_SIZE
+        rows = rows[:HISTORY_PAGE_SIZE]
+        if rows:
+            self.before_id = rows[-1]['id']
+        button.disabled = not has_more
+        await interaction.response.edit_message(embed=build_history_embed(self.target, rows), view=self)
+
+@bot.tree.command(name="gecmis", description="Reputation geçmişini göster")
+async def history(interaction: discord.Interaction, member: discord.Member = None):
+    target = member or interaction.user
+    rows = await get_user_history(target.id, interaction.guild_id, HISTORY_PAGE_SIZE + 1)
+    has_more = len(rows) > HISTORY_PAGE_SIZE
+    rows = rows[:HISTORY_PAGE_SIZE]
+    
+    embed = build_history_embed(target, rows)
+    if has_more:
+        view = HistoryView(interaction.user.id, target, interaction.guild_id, rows[-1]['id'])
+        await interaction.response.send_message(embed=embed, view=view)
+    else:
+        await interaction.response.send_message(embed=embed)
+
+WORD_CATEGORY_CHOICES = [
+    app_commands.Choice(name="Küfür", value="profanity"),
+    app_commands.Choice(name="Hakaret", value="insult"),
+    app_commands.Choice(name="Ağır", value="severe")
+]
+
+SETTING_CHOICES = [
+    app_commands.Choice(name="Küfür cezası", value="profanity_penalty"),
+    app_commands.Choice(name="Hakaret cezası", value="insult_penalty"),
+    app_commands.Choice(name="Ağır ceza", value="severe_penalty"),
+    app_commands.Choice(name="Spam cezası", value="spam_penalty"),
+    app_commands.Choice(name="Susturma eşiği", value="mute_threshold"),
+    app_commands.Choice(name="Ban eşiği", value="ban_threshold")
+]
+
+filter_group = app_commands.Group(
+    name="filtre", description="Sunucuya özel kelime filtresi",
+    guild_only=True, default_permissions=discord.Permissions(manage_guild=True)
+)
+
+@filter_group.command(name="ekle", description="Filtreye kelime ekle")
+@app_commands.choices(kategori=WORD_CATEGORY_CHOICES)
+async def filter_add(interaction: discord.Interaction, kelime: str, kategori: str = "profanity"):
+    word = normalize_guild_word(kelime.strip(), kategori)
+    if not word or len(word) > 50:
+        await interaction.response.send_message("Kelime 1-50 karakter olmalı!", ephemeral=True)
+        return
+    
+    if word in DEFAULT_WORD_LISTS[kategori]:
+        # Kapatılmış varsayılan kelimeyi tekrar aç
+        await delete_guild_word(interaction.guild_id, word, kategori)
+    else:
+        await set_guild_word(interaction.guild_id, word, kategori, True)
+    await bot.filters.reload(interaction.guild_id)
+    await interaction.response.send_message(f"✅ `{word}` filtreye eklendi.", ephemeral=True)
+
+@filter_group.command(name="sil", description="Filtreden kelime çıkar")
+@app_commands.choices(kategori=WORD_CATEGORY_CHOICES)
+async def filter_remove(interaction: discord.Interaction, kelime: str, kategori: str = "profanity"):
+    word = normalize_guild_word(kelime.strip(), kategori)
+    if word in DEFAULT_WORD_LISTS[kategori]:
+        # Varsayılan kelimeler silinemez, bu sunucu için kapatılır
+        await set_guild_word(interaction.guild_id, word, kategori, False)
+    else:
+        words = await get_guild_words(interaction.guild_id)
+        if not any(row['word'] == word and row['category'] == kategori for row in words):
+            await interaction.response.send_message(f"❌ `{word}` filtrede yok.", ephemeral=True)
+            return
+        await delete_guild_word(interaction.guild_id, word, kategori)
+    
+    await bot.filters.reload(interaction.guild_id)
+    await interaction.response.send_message(f"✅ `{word}` filtreden çıkarıldı.", ephemeral=True)
+
+@filter_group.command(name="liste", description="Sunucuya özel filtre değişikliklerini göster")
+async def filter_list(interaction: discord.Interaction):
+    words = await get_guild_words(interaction.guild_id)
+    settings = await get_guild_settings(interaction.guild_id)
+    
+    added = [f"`{row['word']}` ({row['category']})" for row in words if row['enabled']]
+    removed = [f"`{row['word']}` ({row['category']})" for row in words if not row['enabled']]
+    
+    embed = discord.Embed(title="🧹 Filtre Ayarları", color=discord.Color.blue())
+    embed.add_field(name="Eklenen", value=", ".join(added)[:1024] or "-", inline=False)
+    embed.add_field(name="Kapatılan", value=", ".join(removed)[:1024] or "-", inline=False)
+    embed.add_field(
+        name="Ayarlar",
+        value="\n".join(f"{key}: **{settings.get(key, value)}**" for key, value in DEFAULT_GUILD_SETTINGS.items()),
+        inline=False
+    )
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+bot.tree.add_command(filter_group)
+
+@bot.tree.command(name="ayar", description="Ceza puanı veya eşik ayarla")
+@app_commands.guild_only()
+@app_commands.default_permissions(manage_guild=True)
+@app_commands.choices(ayar=SETTING_CHOICES)
+async def settings_cmd(interaction: discord.Interaction, ayar: str, deger: app_commands.Range[int, 0, MAX_REPUTATION]):
+    await set_guild_setting(interaction.guild_id, ayar, deger)
+    await bot.filters.reload(interaction.guild_id)
+    await interaction.response.send_message(f"✅ `{ayar}` = **{deger}**", ephemeral=True)
+
+@bot.tree.command(name="metrikler", description="Bot performans metrikleri")
+@app_commands.default_permissions(administrator=True)
+async def metrics_cmd(interaction: discord.Interaction):
+    embed = discord.Embed(title="📈 Metrikler", color=discord.Color.blue())
+    
+    if metrics.histograms:
+        lines = []
+        for stage, histogram in sorted(metrics.histograms.items()):
+            avg = histogram.total / histogram.count * 1000
+            p99 = histogram.quantile(0.99) * 1000
+            lines.append(f"`{stage}` n={histogram.count} ort={avg:.1f}ms p99≤{p99:.0f}ms")
+        embed.add_field(name="Aşamalar", value="\n".join(lines)[:1024], inline=False)
+    else:
+        embed.add_field(name="Aşamalar", value="Süre ölçümü kapalı (METRICS_ENABLED=1)", inline=False)
+    
+    counters = "\n".join(f"{name}: **{value}**" for name, value in sorted(metrics.counters.items()))
+    embed.add_field(name="Sayaçlar", value=counters[:1024] or "-", inline=True)
+    gauges = "\n".join(f"{name}: **{value:g}**" for name, value in sorted(metrics._gauge_values().items()))
+    embed.add_field(name="Durum", value=gauges[:1024] or "-", inline=True)
+    
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
 @bot.tree.command(name="yardim", description="Yardım menüsü")
 async def help_cmd(interaction: discord.Interaction):
     embed = discord.Embed(title="🛡️ Guardian Bot", color=discord.Color.blue())
-    embed.add_field(name="📊 Reputation", value="`/rep` `/siralama`", inline=True)
-    embed.add_field(name="🛡️ Moderasyon", value="`/uyar` `/odul`", inline=True)
+    embed.add_field(name="📊 Reputation", value="`/rep` `/siralama` `/gecmis`", inline=True)
+    embed.add_field(name="🛡️ Moderasyon", value="`/uyar` `/odul` `/filtre` `/ayar`", inline=True)
     embed.add_field(name="🤖 AI", value="`/sor`", inline=True)
     embed.set_footer(text="Küfür/hakaret otomatik algılanır")
     
@@ -536,8 +3287,50 @@ def main():
         print("Ortam değişkeni olarak DISCORD_TOKEN ayarla.")
         return
     
+    if SHARD_IDS is not None and not SHARD_COUNT:
+        print("❌ SHARD_IDS kullanılırken SHARD_COUNT da ayarlanmalı!")
+        return
+    if SHARD_IDS is not None and max(SHARD_IDS) >= SHARD_COUNT:
+        print(f"❌ SHARD_IDS 0 ile {SHARD_COUNT - 1} arasında olmalı!")
+        return
+    
+    if SHARD_WORKERS > 1 and SHARD_IDS is None:
+        run_shard_workers(SHARD_WORKERS)
+        return
+    
     print("🚀 Guardian Bot başlatılıyor...")
     bot.run(token)
 
+# Shard'ları SHARD_WORKERS kadar alt sürece dağıtır; her süreç kendi olay döngüsünde
+# çalışır ve durum DATABASE_URL'deki ortak veritabanında tutulur. Bir süreç çıkarsa
+# diğerleri de durdurulur ki platform hepsini birlikte yeniden başlatsın.
+def run_shard_workers(workers: int):
+    if not SHARD_COUNT:
+        print("❌ SHARD_WORKERS kullanılırken SHARD_COUNT da ayarlanmalı!")
+        return
+    if not DATABASE_URL:
+        print("⚠️ DATABASE_URL yok, süreçler aynı SQLite dosyasını paylaşacak (yalnızca tek makine)")
+    
+    processes = []
+    for worker in range(min(workers, SHARD_COUNT)):
+        shard_ids = list(range(worker, SHARD_COUNT, workers))
+        env = dict(os.environ, SHARD_IDS=','.join(map(str, shard_ids)), SHARD_WORKERS='1')
+        if METRICS_PORT:
+            env['METRICS_PORT'] = str(METRICS_PORT + worker)
+        processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env))
+        print(f"🚀 Süreç {worker} başlatıldı (shard {shard_ids})")
+    
+    try:
+        while all(process.poll() is None for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            process.wait()
+
 if __name__ == "__main__":
     main()